@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module for the persistent caches kept under PATH_CACHE.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import closing
+
+import six
+
+from .utils import mkdir_p, replace_file
+
+
+class JsonCache(object):
+    """
+    A small persistent dictionary stored as a JSON file, where every entry
+    expires after its own time to live.
+
+    Changes are only written to disk by save().  Entries changed by other
+    processes in the meantime are kept, unless we changed them as well.
+
+    :param filename: Path of the JSON file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.filename) as f:
+                entries = json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+        if not isinstance(entries, dict):
+            return {}
+        return entries
+
+    def get(self, key):
+        """
+        Return the value stored for key, or None if there is no such entry
+        or if it has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            if entry['expires'] < time.time():
+                del self._entries[key]
+                self._changed.add(key)
+                return None
+
+            return entry['value']
+
+    def set(self, key, value, ttl):
+        """
+        Store value for key during ttl seconds.
+        """
+        with self._lock:
+            self._entries[key] = {'expires': time.time() + ttl,
+                                  'value': value}
+            self._changed.add(key)
+
+    def delete(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._changed.add(key)
+
+    def save(self):
+        """
+        Write the changed entries to disk.
+        """
+        with self._lock:
+            if not self._changed:
+                return
+
+            entries = self._load()
+            for key in self._changed:
+                if key in self._entries:
+                    entries[key] = self._entries[key]
+                else:
+                    entries.pop(key, None)
+
+            now = time.time()
+            entries = dict((k, v) for k, v in entries.items()
+                           if v['expires'] >= now)
+
+            mkdir_p(os.path.dirname(self.filename), 0o700)
+            tmp_filename = '{0}.{1}.tmp'.format(self.filename, os.getpid())
+            with open(tmp_filename, 'w') as f:
+                json.dump(entries, f)
+            replace_file(tmp_filename, self.filename)
+
+            self._entries = entries
+            self._changed.clear()
+
+
+class MissingCache(JsonCache):
+    """
+    Remembers the URLs which failed permanently with a 404 or 410 status,
+    so that we do not go through all the retries for them on every run.
+
+    :param filename: Path of the JSON file.
+    :param ttl: Number of seconds before a missing URL is tried again.
+    :param recheck: If set, all URLs are tried again, but the cache is
+        still updated with the results.
+    """
+
+    # HTTP statuses telling that a resource is not there
+    MISSING_STATUSES = (404, 410)
+
+    def __init__(self, filename, ttl, recheck=False):
+        JsonCache.__init__(self, filename)
+        self.ttl = ttl
+        self.recheck = recheck
+
+    def is_missing(self, url):
+        if self.recheck:
+            return False
+        return self.get(url) is not None
+
+    def record_failure(self, url, status_code):
+        """
+        Remember the url if status_code means that it is missing.
+        """
+        if status_code in self.MISSING_STATUSES:
+            logging.debug('Remembering missing resource %s', url)
+            self.set(url, status_code, self.ttl)
+
+
+class VideoCache(JsonCache):
+    """
+    Remembers the video URLs found on lecture pages (preview and hidden
+    videos), so that we do not have to fetch and parse those pages again.
+
+    :param filename: Path of the JSON file.
+    :param ttl: Number of seconds during which a video URL is reused.
+    """
+
+    def __init__(self, filename, ttl):
+        JsonCache.__init__(self, filename)
+        self.ttl = ttl
+
+    def lookup(self, page_url):
+        """
+        Return the video URL found on page_url, or None.
+        """
+        return self.get(page_url)
+
+    def remember(self, page_url, video_url):
+        if self.ttl > 0:
+            self.set(page_url, video_url, self.ttl)
+
+
+def _load_gzip_json(filename):
+    """
+    Return the value stored in the compressed JSON file, or None if it
+    cannot be read.
+    """
+    try:
+        with closing(gzip.open(filename, 'rb')) as f:
+            return json.loads(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError, EOFError):
+        return None
+
+
+def _store_gzip_json(filename, value):
+    """
+    Write value to the compressed JSON file, atomically, as the file may
+    be written by other threads and processes at the same time.
+    """
+    mkdir_p(os.path.dirname(filename), 0o700)
+    tmp_filename = '{0}.{1}.{2}.tmp'.format(
+        filename, os.getpid(), threading.current_thread().ident)
+    with closing(gzip.open(tmp_filename, 'wb')) as f:
+        f.write(json.dumps(value).encode('utf-8'))
+    replace_file(tmp_filename, filename)
+
+
+class PageCache(object):
+    """
+    Compressed on-disk cache of web pages, with their validators.
+
+    Pages younger than ttl seconds are used as they are; older ones must be
+    revalidated with the headers from conditional_headers().
+
+    :param directory: Directory where the pages are stored.
+    :param ttl: Number of seconds during which a page is used without
+        asking the server.
+    """
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _filename(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.json.gz')
+
+    def load(self, url):
+        """
+        Return the cached entry for url, a dictionary with the keys 'text',
+        'etag', 'last_modified' and 'fetched', or None.
+        """
+        entry = _load_gzip_json(self._filename(url))
+        if entry is None or entry.get('url') != url:
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched'] < self.ttl
+
+    def conditional_headers(self, entry):
+        """
+        Return the headers to revalidate the given entry.
+        """
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, text, etag=None, last_modified=None):
+        """
+        Store the page text of url, along with its validators.
+        """
+        entry = {'url': url,
+                 'text': text,
+                 'etag': etag,
+                 'last_modified': last_modified,
+                 'fetched': time.time()}
+        _store_gzip_json(self._filename(url), entry)
+
+
+class ParseCache(object):
+    """
+    Compressed on-disk cache of the results of parsing pages, keyed by a
+    hash of the page and of the parsing options, so that a page which has
+    not changed is not parsed again.
+
+    :param directory: Directory where the results are stored.
+    :param max_entries: Number of results kept; the oldest ones are
+        removed.
+    """
+
+    def __init__(self, directory, max_entries=100):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    @staticmethod
+    def make_key(page, *options):
+        """
+        Return the key of page parsed with the given options.
+        """
+        if isinstance(page, six.text_type):
+            page = page.encode('utf-8')
+        key = hashlib.sha1(page)
+        key.update(repr(options).encode('utf-8'))
+        return key.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + '.json.gz')
+
+    def load(self, key):
+        """
+        Return the value stored for key, or None.
+        """
+        return _load_gzip_json(self._filename(key))
+
+    def store(self, key, value):
+        """
+        Store value, which must be serializable to JSON, for key.
+        """
+        _store_gzip_json(self._filename(key), value)
+        self._prune()
+
+    def _prune(self):
+        try:
+            filenames = [os.path.join(self.directory, name)
+                         for name in os.listdir(self.directory)
+                         if name.endswith('.json.gz')]
+            if len(filenames) <= self.max_entries:
+                return
+            filenames.sort(key=os.path.getmtime)
+            for filename in filenames[:-self.max_entries]:
+                os.remove(filename)
+        except OSError as e:
+            logging.debug('Could not prune %s: %s', self.directory, e)
@@ -6,6 +6,7 @@ Cookie handling module.
 
 import logging
 import os
+import threading
 
 import requests
 import six
@@ -13,6 +14,7 @@ import six
 from six.moves import StringIO
 from six.moves import http_cookiejar as cookielib
 from .define import AUTH_URL, CLASS_URL, AUTH_REDIRECT_URL, PATH_COOKIES
+from .network import create_session
 from .utils import mkdir_p
 
 
@@ -75,9 +77,11 @@ def login(session, class_name, username, password):
     except KeyError:
         pass
 
-    # Hit class url to obtain csrf_token
+    # Hit class url to obtain csrf_token.  We use a separate session so
+    # that the cookies of the class page do not leak into ours, but still
+    # reuse the shared connections.
     class_url = CLASS_URL.format(class_name=class_name)
-    r = requests.get(class_url, allow_redirects=False)
+    r = create_session().get(class_url, allow_redirects=False)
 
     try:
         r.raise_for_status()
@@ -317,3 +321,69 @@ def get_cookies_for_class(session, class_name,
         else:
             get_authentication_cookies(session, class_name, username, password)
             write_cookies_to_cache(session.cookies, username)
+
+
+class Account(object):
+    """
+    The Coursera account shared by all the classes downloaded in a run.
+
+    The cached cookies are loaded once, and the account is logged in at
+    most once: each class then only needs to go through
+    down_the_wabbit_hole with the account cookies (CAUTH on .coursera.org)
+    to get its own cookies.  The cookie cache is only written by save().
+
+    :param username: Account name, used to find the cookie cache.
+    :param password: Password used if the account must log in.
+    """
+
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+        self.cookies = get_cookies_from_cache(username)
+        self._lock = threading.Lock()
+        self._validated = False  # whether the account cookies worked
+        self._changed = False
+
+    def _login(self, session, class_name):
+        login(session, class_name, self.username, self.password)
+        self._validated = True
+
+    def authenticate(self, session, class_name):
+        """
+        Add the cookies needed to access class_name to session, logging
+        in first if the account is not logged in yet or if its cached
+        cookies turn out to be stale.
+        """
+        with self._lock:
+            session.cookies.update(self.cookies)
+
+            if session.cookies.get('CAUTH', domain='.coursera.org'):
+                logging.debug('Already logged in on accounts.coursera.org.')
+            else:
+                self._login(session, class_name)
+
+            try:
+                _get_authentication_cookies(session, class_name,
+                                            self.username, self.password)
+            except AuthenticationFailed:
+                if self._validated:
+                    raise
+
+                logging.debug('Stale session.')
+                self._login(session, class_name)
+                _get_authentication_cookies(session, class_name,
+                                            self.username, self.password)
+
+            logging.info('Found authentication cookies.')
+            self._validated = True
+            self.cookies.update(session.cookies)
+            self._changed = True
+
+    def save(self):
+        """
+        Write the cookies to the cache if they have changed.
+        """
+        with self._lock:
+            if self._changed:
+                write_cookies_to_cache(self.cookies, self.username)
+                self._changed = False
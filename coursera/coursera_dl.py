@@ -41,6 +41,7 @@ Legalese:
 
 import argparse
 import datetime
+import functools
 import json
 import logging
 import os
@@ -49,32 +50,33 @@ import shutil
 import subprocess
 import sys
 import time
-import glob
 
+from email.utils import formatdate
 from distutils.version import LooseVersion as V
 
 import requests
 from six import iteritems
 
-try:
-    from BeautifulSoup import BeautifulSoup
-except ImportError:
-    from bs4 import BeautifulSoup as BeautifulSoup_
-    try:
-        # Use html5lib for parsing if available
-        import html5lib
-        BeautifulSoup = lambda page: BeautifulSoup_(page, 'html5lib')
-    except ImportError:
-        BeautifulSoup = lambda page: BeautifulSoup_(page, 'html.parser')
-
-
 from .cookies import (
-    AuthenticationFailed, ClassNotFound,
+    Account, AuthenticationFailed, ClassNotFound,
     get_cookies_for_class, make_cookie_values)
 from .credentials import get_credentials, CredentialsError
-from .define import CLASS_URL, ABOUT_URL, PATH_CACHE
-from .downloaders import get_downloader
-from .utils import clean_filename, get_anchor_format, mkdir_p, fix_url
+from .cache import MissingCache, PageCache, ParseCache, VideoCache
+from .define import (
+    CLASS_URL, ABOUT_URL, PATH_CACHE, PATH_MISSING_CACHE, PATH_PAGE_CACHE,
+    PATH_PARSE_CACHE, PATH_VIDEO_CACHE)
+from .downloaders import format_bytes, get_downloader
+from .models import Lecture, Resource, Section, make_lecture
+from .network import configure_pool, create_session
+from .parsers import (
+    SOUP_PARSERS, SYLLABUS_STRAINER, extract_sections, get_soup_parser,
+    make_soup, set_soup_parser)
+from .scheduler import DownloadJob, DownloadPlan, DownloadScheduler
+from .state import DownloadState
+from .utils import (
+    DirectoryIndex, clean_filename, clean_filenames, get_anchor_format,
+    lookahead_map, mkdir_p, fix_url, parallel_map, process_map,
+    replace_file, scan_directory)
 
 # URL containing information about outdated modules
 _see_url = " See https://github.com/coursera-dl/coursera/issues/139"
@@ -104,9 +106,25 @@ def get_syllabus_url(class_name, preview):
 def get_page(session, url):
     """
     Download an HTML page using the requests session.
+
+    If the session has a page_cache, fresh cached pages are used directly
+    and stale ones are revalidated with a conditional request.
     """
 
-    r = session.get(url)
+    cache = getattr(session, 'page_cache', None)
+    entry = cache.load(url) if cache is not None else None
+
+    if entry is not None and cache.is_fresh(entry):
+        logging.debug('Using cached page %s', url)
+        return entry['text']
+
+    headers = cache.conditional_headers(entry) if entry is not None else {}
+    r = session.get(url, headers=headers)
+
+    if entry is not None and r.status_code == 304:
+        logging.debug('Cached page %s is still valid', url)
+        cache.store(url, entry['text'], entry['etag'], entry['last_modified'])
+        return entry['text']
 
     try:
         r.raise_for_status()
@@ -114,6 +132,12 @@ def get_page(session, url):
         logging.error("Error %s getting page %s", e, url)
         raise
 
+    # Redirected pages are not cached, since they are usually the login
+    # page instead of the one we asked for.
+    if cache is not None and r.url == url:
+        cache.store(url, r.text, r.headers.get('etag'),
+                    r.headers.get('last-modified'))
+
     return r.text
 
 
@@ -122,14 +146,21 @@ def grab_hidden_video_url(session, href):
     Follow some extra redirects to grab hidden video URLs (like those from
     University of Washington).
     """
+    cache = getattr(session, 'video_cache', None)
+    cached_src = cache.lookup(href) if cache is not None else None
+    if cached_src is not None:
+        return cached_src
+
     try:
         page = get_page(session, href)
     except requests.exceptions.HTTPError:
         return None
 
-    soup = BeautifulSoup(page)
+    soup = make_soup(page)
     l = soup.find('source', attrs={'type': 'video/mp4'})
     if l is not None:
+        if cache is not None:
+            cache.remember(href, l['src'])
         return l['src']
     else:
         return None
@@ -183,94 +214,336 @@ def get_video(session, url):
     """
     Parses a Coursera video page
     """
+    cache = getattr(session, 'video_cache', None)
+    cached_src = cache.lookup(url) if cache is not None else None
+    if cached_src is not None:
+        return cached_src
 
     page = get_page(session, url)
-    soup = BeautifulSoup(page)
-    return soup.find(attrs={'type': re.compile('^video/mp4')})['src']
+    soup = make_soup(page)
+    src = soup.find(attrs={'type': re.compile('^video/mp4')})['src']
+
+    if cache is not None:
+        cache.remember(url, src)
+    return src
 
 
-def parse_syllabus(session, page, reverse=False, intact_fnames=False):
+class PendingVideo(object):
     """
-    Parses a Coursera course listing/syllabus page.  Each section is a week
-    of classes.
+    Placeholder for a video whose URL can only be found by fetching another
+    page: either a preview page or a hidden video iframe.  Placeholders are
+    stored in the 'mp4' list of a lecture, in place of the (url, title)
+    tuple, until they are resolved with resolve_videos.
+    """
+
+    PREVIEW = 'preview'
+    IFRAME = 'iframe'
+
+    def __init__(self, kind, page_url):
+        self.kind = kind
+        self.page_url = page_url
+
+    def resolve(self, session):
+        """
+        Return the video URL, or None if it could not be found.
+        """
+        if self.kind == self.PREVIEW:
+            return fix_url(get_video(session, self.page_url))
+        return fix_url(grab_hidden_video_url(session, self.page_url))
+
+
+def _number_titles(resources):
+    """
+    Make the titles of the resources of a given format unique.
+    """
+    count = len(resources)
+    for i, r in enumerate(resources):
+        if (count == i + 1):
+            # for backward compatibility, we do not add the title
+            # to the filename (see Lecture.filename)
+            resources[i] = Resource(r[0], '')
+        else:
+            # make sure the title is unique
+            resources[i] = Resource(r[0], '{0:d}_{1}'.format(i, r[1]))
+
+
+def _soup_sections(page):
+    """
+    Generate the sections of a syllabus page, like
+    parsers.extract_sections, but with BeautifulSoup.
+    """
+    header_class = re.compile('^course-item-list-header')
+    headers = make_soup(page, SYLLABUS_STRAINER).findAll(
+        attrs={'class': header_class})
+    if not headers:
+        # the sections are not in a course item list
+        headers = make_soup(page).findAll(attrs={'class': header_class})
+
+    for stag in headers:
+        assert stag.contents[0] is not None, "couldn't find section"
+        lectures = []
+        for vtag in stag.nextSibling.findAll('li'):
+            assert vtag.a.contents[0], "couldn't get lecture name"
+            lectures.append((vtag.a.contents[0], vtag.findAll('a')))
+        yield stag.contents[0].contents[1], lectures
+
+
+def parse_syllabus_page(page, intact_fnames=False, parser='soup'):
+    """
+    Parses a Coursera course listing/syllabus page, without making any
+    network request.  Each section is a week of classes.
+
+    The page is read with BeautifulSoup, or with the event driven
+    extractor of the parsers module if `parser` is 'fast'; BeautifulSoup
+    is still used if the latter fails.
+
+    The videos which must be looked up on other pages are left as
+    PendingVideo placeholders, see resolve_videos.
+    """
+
+    if parser == 'fast':
+        try:
+            return _build_sections(extract_sections(page), intact_fnames)
+        except Exception as e:
+            logging.warn('The fast parser failed (%s), falling back to'
+                         ' BeautifulSoup', e)
+
+    return _build_sections(_soup_sections(page), intact_fnames)
+
+
+def _build_sections(raw_sections, intact_fnames=False):
+    """
+    Build the sections from the section names, lecture names and link
+    attributes found on the page.
     """
 
     sections = []
-    soup = BeautifulSoup(page)
 
     # traverse sections
-    for stag in soup.findAll(attrs={'class':
-                                    re.compile('^course-item-list-header')}):
-        assert stag.contents[0] is not None, "couldn't find section"
-        untouched_fname = stag.contents[0].contents[1]
+    for untouched_fname, raw_lectures in raw_sections:
         section_name = clean_filename(untouched_fname, intact_fnames)
         logging.info(section_name)
         lectures = []  # resources for 1 lecture
 
         # traverse resources (e.g., video, ppt, ..)
-        for vtag in stag.nextSibling.findAll('li'):
-            assert vtag.a.contents[0], "couldn't get lecture name"
-            untouched_fname = vtag.a.contents[0]
+        for untouched_fname, links in raw_lectures:
             vname = clean_filename(untouched_fname, intact_fnames)
             logging.info('  %s', vname)
             lecture = {}
-            lecture_page = None
 
-            for a in vtag.findAll('a'):
+            titles = clean_filenames((a.get('title', '') for a in links),
+                                     intact_fnames)
+            for a, title in zip(links, titles):
                 href = fix_url(a['href'])
-                untouched_fname = a.get('title', '')
-                title = clean_filename(untouched_fname, intact_fnames)
                 fmt = get_anchor_format(href)
                 logging.debug('    %s %s', fmt, href)
                 if fmt:
                     lecture[fmt] = lecture.get(fmt, [])
-                    lecture[fmt].append((href, title))
+                    lecture[fmt].append(Resource(href, title))
                     continue
 
                 # Special case: find preview URLs
                 lecture_page = transform_preview_url(href)
                 if lecture_page:
-                    try:
-                        href = get_video(session, lecture_page)
-                        lecture['mp4'] = lecture.get('mp4', [])
-                        lecture['mp4'].append((fix_url(href), ''))
-                    except TypeError:
-                        logging.warn(
-                            'Could not get resource: %s', lecture_page)
+                    lecture['mp4'] = lecture.get('mp4', [])
+                    lecture['mp4'].append(Resource(
+                        PendingVideo(PendingVideo.PREVIEW, lecture_page)))
 
             # Special case: we possibly have hidden video links---thanks to
-            # the University of Washington for that.
-            if 'mp4' not in lecture:
-                for a in vtag.findAll('a'):
+            # the University of Washington for that.  They are only used if
+            # no other video is found.
+            if all(isinstance(r[0], PendingVideo)
+                   for r in lecture.get('mp4', [])):
+                for a in links:
                     if a.get('data-modal-iframe'):
-                        href = grab_hidden_video_url(
-                            session, a['data-modal-iframe'])
-                        href = fix_url(href)
-                        fmt = 'mp4'
-                        logging.debug('    %s %s', fmt, href)
-                        if href is not None:
-                            lecture[fmt] = lecture.get(fmt, [])
-                            lecture[fmt].append((href, ''))
+                        lecture['mp4'] = lecture.get('mp4', [])
+                        lecture['mp4'].append(Resource(
+                            PendingVideo(PendingVideo.IFRAME,
+                                         a['data-modal-iframe'])))
 
             for fmt in lecture:
-                count = len(lecture[fmt])
-                for i, r in enumerate(lecture[fmt]):
-                    if (count == i + 1):
-                        # for backward compatibility, we do not add the title
-                        # to the filename (format_combine_number_resource and
-                        # format_resource)
-                        lecture[fmt][i] = (r[0], '')
-                    else:
-                        # make sure the title is unique
-                        lecture[fmt][i] = (r[0], '{0:d}_{1}'.format(i, r[1]))
+                if not is_pending(lecture[fmt]):
+                    _number_titles(lecture[fmt])
 
-            lectures.append((vname, lecture))
+            lectures.append(make_lecture(vname, lecture))
 
-        sections.append((section_name, lectures))
+        sections.append(Section(section_name, lectures))
 
     logging.info('Found %d sections and %d lectures on this page',
                  len(sections), sum(len(s[1]) for s in sections))
 
+    return sections
+
+
+def is_pending(resources):
+    """
+    Tell whether some of the given resources are PendingVideo placeholders.
+    """
+    return any(isinstance(r[0], PendingVideo) for r in resources)
+
+
+def resolve_videos(session, lectures, jobs=1):
+    """
+    Replace the PendingVideo placeholders of the given lecture dictionaries
+    by the actual video URLs, fetching up to `jobs` pages at once.
+    """
+
+    def resolve(pending):
+        """
+        Return the list of URLs the placeholder stands for.
+        """
+        if pending.kind == PendingVideo.PREVIEW:
+            try:
+                return [pending.resolve(session)]
+            except TypeError:
+                logging.warn('Could not get resource: %s', pending.page_url)
+                return []
+
+        href = pending.resolve(session)
+        logging.debug('    %s %s', 'mp4', href)
+        return [href] if href is not None else []
+
+    def resolve_all(kind):
+        pending = [r[0] for lecture in pending_lectures
+                   for r in lecture['mp4']
+                   if isinstance(r[0], PendingVideo) and r[0].kind == kind]
+        return dict(zip(pending, parallel_map(resolve, pending, jobs)))
+
+    def substitute(resources, resolved):
+        result = []
+        for r in resources:
+            if r[0] in resolved:
+                result.extend(Resource(href, r[1])
+                              for href in resolved[r[0]])
+            elif not isinstance(r[0], PendingVideo):
+                result.append(r)
+        return result
+
+    pending_lectures = [lecture for lecture in lectures
+                        if is_pending(lecture.get('mp4', []))]
+
+    # First the preview pages, and then the hidden videos of the lectures
+    # for which no video was found otherwise.
+    resolved = resolve_all(PendingVideo.PREVIEW)
+    for lecture in pending_lectures:
+        videos = substitute(lecture['mp4'], resolved)
+        if videos:
+            lecture['mp4'] = videos
+
+    resolved = resolve_all(PendingVideo.IFRAME)
+    for lecture in pending_lectures:
+        videos = substitute(lecture['mp4'], resolved)
+        if videos:
+            lecture['mp4'] = videos
+            _number_titles(videos)
+        else:
+            del lecture['mp4']
+
+
+def _encode_sections(sections):
+    """
+    Return the sections in a form which can be serialized to JSON.
+    """
+    def encode(url):
+        if isinstance(url, PendingVideo):
+            return {'kind': url.kind, 'page_url': url.page_url}
+        return url
+
+    return [[name, [[vname, dict(
+        (fmt, [[encode(r[0]), r[1]] for r in resources])
+        for fmt, resources in iteritems(lecture))]
+        for (vname, lecture) in lectures]]
+        for (name, lectures) in sections]
+
+
+def _decode_sections(data):
+    """
+    Return the sections encoded by _encode_sections.
+    """
+    def decode(url):
+        if isinstance(url, dict):
+            return PendingVideo(url['kind'], url['page_url'])
+        return url
+
+    return [Section(name, [make_lecture(vname, dict(
+        (fmt, [(decode(r[0]), r[1]) for r in resources])
+        for fmt, resources in iteritems(lecture)))
+        for (vname, lecture) in lectures])
+        for (name, lectures) in data]
+
+
+def _parse_page_in_process(task):
+    """
+    Parse a syllabus page in a worker process of parse_syllabi.
+    """
+    page, intact_fnames, parser, soup_parser = task
+    set_soup_parser(soup_parser)
+    return parse_syllabus_page(page, intact_fnames, parser)
+
+
+def parse_syllabi(pages, intact_fnames=False, parser='soup', processes=1,
+                  cache=None):
+    """
+    Parses several syllabus pages with parse_syllabus_page, in up to
+    `processes` worker processes, as parsing is CPU bound.  The results
+    already in `cache` (a ParseCache) are reused.
+
+    Returns the list of the sections of each page, to be given to
+    parse_syllabus.
+    """
+    soup_parser = get_soup_parser()
+    keys = [None] * len(pages)
+    results = [None] * len(pages)
+
+    if cache is not None:
+        for i, page in enumerate(pages):
+            keys[i] = cache.make_key(page, intact_fnames, parser,
+                                     soup_parser)
+            cached = cache.load(keys[i])
+            if cached is not None:
+                logging.info('The syllabus has not changed since it was'
+                             ' parsed')
+                results[i] = _decode_sections(cached)
+
+    todo = [i for i, sections in enumerate(results) if sections is None]
+    parsed = process_map(
+        _parse_page_in_process,
+        [(pages[i], intact_fnames, parser, soup_parser) for i in todo],
+        processes)
+
+    for i, sections in zip(todo, parsed):
+        results[i] = sections
+        if cache is not None:
+            cache.store(keys[i], _encode_sections(sections))
+
+    return results
+
+
+def parse_syllabus(session, page, reverse=False, intact_fnames=False,
+                   jobs=1, lazy=False, parser='soup', parsed=None):
+    """
+    Parses a Coursera course listing/syllabus page.  Each section is a week
+    of classes.  The preview and hidden video pages are fetched with up to
+    `jobs` requests at once, unless `lazy` is set, in which case they are
+    left for download_lectures to resolve only if they are needed.
+
+    If the session has a parse_cache, the result of parsing a page which
+    has already been seen is reused.  The page is not parsed at all if its
+    sections are given in `parsed` (see parse_syllabi).
+    """
+
+    sections = parsed
+    if sections is None:
+        sections = parse_syllabi([page], intact_fnames, parser,
+                                 cache=getattr(session, 'parse_cache',
+                                               None))[0]
+
+    if not lazy:
+        resolve_videos(session,
+                       [lecture for section in sections
+                        for (vname, lecture) in section[1]],
+                       jobs)
+
     if sections and reverse:
         sections.reverse()
 
@@ -306,65 +579,71 @@ def download_about(session, class_name, path='', overwrite=False):
         about_file.write(json_data)
 
 
-def download_lectures(downloader,
-                      class_name,
-                      sections,
-                      file_formats,
-                      overwrite=False,
-                      skip_download=False,
-                      section_filter=None,
-                      lecture_filter=None,
-                      resource_filter=None,
-                      path='',
-                      verbose_dirs=False,
-                      preview=False,
-                      combined_section_lectures_nums=False,
-                      hooks=None,
-                      playlist=False,
-                      intact_fnames=False
-                      ):
-    """
-    Downloads lecture resources described by sections.
-    Returns True if the class appears completed.
+def plan_lectures(class_name,
+                  sections,
+                  file_formats,
+                  overwrite=False,
+                  section_filter=None,
+                  lecture_filter=None,
+                  resource_filter=None,
+                  path='',
+                  verbose_dirs=False,
+                  combined_section_lectures_nums=False,
+                  missing_cache=None,
+                  state=None,
+                  refresh=False,
+                  session=None,
+                  resolve_jobs=1):
     """
-    last_update = -1
-
-    def format_section(num, section):
-        sec = '%02d_%s' % (num, section)
-        if verbose_dirs:
-            sec = class_name.upper() + '_' + sec
-        return sec
+    Returns the DownloadPlan of the lecture resources described by
+    sections, without downloading anything.
 
-    def format_resource(num, name, title, fmt):
-        if title:
-            title = '_' + title
-        return '%02d_%s%s.%s' % (num, name, title, fmt)
+    Resources known to be missing by `missing_cache` are left out.  When a
+    DownloadState is given, the resources recorded there are not looked up
+    on disk.  With `refresh`, the resources already downloaded are planned
+    with conditional headers, to be downloaded again only if they have
+    changed.
 
-    def format_combine_number_resource(secnum, lecnum, lecname, title, fmt):
-        if title:
-            title = '_' + title
-        return '%02d_%02d_%s%s.%s' % (secnum, lecnum, lecname, title, fmt)
-
-    for (secnum, (section, lectures)) in enumerate(sections):
-        if section_filter and not re.search(section_filter, section):
+    Videos left pending by parse_syllabus(lazy=True) are resolved with
+    `session`, only for the lectures selected by the filters.
+    """
+    plan = DownloadPlan()
+
+    # every section directory is listed once, instead of probing each file
+    index = DirectoryIndex()
+
+    if 'mp4' in file_formats or 'all' in file_formats:
+        selected = [lecture
+                    for (section, lectures) in sections
+                    if not section_filter or re.search(section_filter,
+                                                       section)
+                    for (lecname, lecture) in lectures
+                    if not lecture_filter or re.search(lecture_filter,
+                                                       lecname)]
+        resolve_videos(session, selected, resolve_jobs)
+
+    for (secnum, section) in enumerate(sections):
+        section = Section(*section)
+        if section_filter and not re.search(section_filter, section.name):
             logging.debug('Skipping b/c of sf: %s %s', section_filter,
-                          section)
+                          section.name)
             continue
-        sec = os.path.join(path, class_name, format_section(secnum + 1,
-                                                            section))
-        for (lecnum, (lecname, lecture)) in enumerate(lectures):
+        sec = os.path.join(path, class_name, section.dirname(
+            secnum + 1, class_name if verbose_dirs else None))
+        for (lecnum, lecture) in enumerate(section.lectures):
+            lecture = Lecture(*lecture)
             if lecture_filter and not re.search(lecture_filter,
-                                                lecname):
+                                                lecture.name):
                 logging.debug('Skipping b/c of lf: %s %s', lecture_filter,
-                              lecname)
+                              lecture.name)
                 continue
 
-            if not os.path.exists(sec):
-                mkdir_p(sec)
+            if sec not in plan.directories:
+                plan.directories.append(sec)
 
             # Select formats to download
             resources_to_get = []
-            for fmt, resources in iteritems(lecture):
+            for fmt, resources in iteritems(lecture.resources):
                 if fmt in file_formats or 'all' in file_formats:
                     for r in resources:
                         if resource_filter and r[1] and not re.search(resource_filter, r[1]):
@@ -376,51 +655,186 @@ def download_lectures(downloader,
                     logging.debug(
                         'Skipping b/c format %s not in %s', fmt, file_formats)
 
-            # write lecture resources
+            # plan lecture resources
             for fmt, url, title in resources_to_get:
-                if combined_section_lectures_nums:
-                    lecfn = os.path.join(
-                        sec,
-                        format_combine_number_resource(
-                            secnum + 1, lecnum + 1, lecname, title, fmt))
-                else:
-                    lecfn = os.path.join(
-                        sec, format_resource(lecnum + 1, lecname, title, fmt))
-
-                if overwrite or not os.path.exists(lecfn):
-                    if not skip_download:
-                        logging.info('Downloading: %s', lecfn)
-                        downloader.download(url, lecfn)
-                    else:
-                        open(lecfn, 'w').close()  # touch
-                    last_update = time.time()
+                lecfn = os.path.join(sec, lecture.filename(
+                    lecnum + 1, title, fmt,
+                    secnum + 1 if combined_section_lectures_nums else None))
+
+                record = None
+                if state is not None and not overwrite:
+                    # known from a previous run, no need to stat the file
+                    record = state.get(lecfn)
+
+                if record is None and (overwrite or
+                                       not index.exists(lecfn)):
+                    if missing_cache is not None and \
+                            missing_cache.is_missing(url):
+                        logging.info('Skipping %s, it was missing last time'
+                                     ' (see --recheck-missing)', lecfn)
+                        continue
+                    plan.add(DownloadJob(url, lecfn, fmt))
+                    continue
+
+                if record is None:
+                    stat = index.stat(lecfn)
+                    mtime = stat.st_mtime
+                    if state is not None:
+                        state.record_file(url, lecfn, stat=stat)
+                        record = state.get(lecfn)
                 else:
-                    logging.info('%s already downloaded', lecfn)
-                    # if this file hasn't been modified in a long time,
-                    # record that time
-                    last_update = max(last_update, os.path.getmtime(lecfn))
+                    mtime = record.completed
 
-        # After fetching resources, create a playlist in M3U format with the
-        # videos downloaded.
-        if playlist:
-            path_to_return = os.getcwd()
+                # if this file hasn't been modified in a long time,
+                # record that time
+                plan.last_update = max(plan.last_update, mtime)
 
-            for (_path, subdirs, files) in os.walk(sec):
-                os.chdir(_path)
-                globbed_videos = glob.glob("*.mp4")
-                m3u_name = os.path.split(_path)[1] + ".m3u"
+                headers = None
+                if refresh:
+                    headers = get_conditional_headers(record, mtime)
+                job = DownloadJob(url, lecfn, fmt, headers, present=True)
+                if record is not None:
+                    job.size = record.size
+                plan.add(job)
 
-                if len(globbed_videos):
-                    with open(m3u_name, "w") as m3u:
-                        for video in globbed_videos:
-                            m3u.write(video + "\n")
-                    os.chdir(path_to_return)
+    return plan
+
+
+def download_lectures(downloader,
+                      class_name,
+                      sections,
+                      file_formats,
+                      overwrite=False,
+                      skip_download=False,
+                      section_filter=None,
+                      lecture_filter=None,
+                      resource_filter=None,
+                      path='',
+                      verbose_dirs=False,
+                      preview=False,
+                      combined_section_lectures_nums=False,
+                      hooks=None,
+                      playlist=False,
+                      intact_fnames=False,
+                      jobs=1,
+                      jobs_per_host=None,
+                      missing_cache=None,
+                      state=None,
+                      refresh=False,
+                      session=None,
+                      resolve_jobs=1,
+                      order=None
+                      ):
+    """
+    Downloads lecture resources described by sections, as planned by
+    plan_lectures(), running up to `jobs` downloads at once.  The new
+    downloads are recorded in `state`, if given.
+
+    With `order` ('largest' or 'smallest'), the sizes of the resources are
+    first asked with HEAD requests, and the downloads are run in that
+    order.  Returns True if the class appears completed.
+    """
+    plan = plan_lectures(class_name, sections, file_formats, overwrite,
+                         section_filter, lecture_filter, resource_filter,
+                         path, verbose_dirs, combined_section_lectures_nums,
+                         missing_cache, state, refresh and not skip_download,
+                         session, resolve_jobs)
+    last_update = plan.last_update
+
+    for sec in plan.directories:
+        mkdir_p(sec)
+
+    for job in plan.jobs:
+        if job.present and job.headers is None:
+            logging.info('%s already downloaded', job.filename)
+
+    if order is not None and session is not None and not skip_download:
+        plan.estimate_sizes(session, jobs)
+
+    jobs_to_get = plan.pending(order)
+    if skip_download:
+        for job in jobs_to_get:
+            open(job.filename, 'w').close()  # touch
+            job.present = True
+            last_update = time.time()
+        jobs_to_get = []
+    else:
+        if any(not job.present for job in jobs_to_get):
+            last_update = time.time()
+        total_size = plan.total_size()
+        if jobs_to_get and total_size is not None:
+            logging.info('%d files to download, %s in total',
+                         len(jobs_to_get), format_bytes(total_size))
+
+    # times at which files were changed by a refresh
+    refreshed = []
+
+    def record_download(job, response):
+        plan.mark_done(job)
+
+        if response is not None and response.status_code == 304:
+            job.present = True
+            logging.info('%s is up to date', job.filename)
+            return
+
+        # the external downloaders do not tell when they fail
+        if not os.path.exists(job.filename):
+            logging.error('Could not download %s', job.filename)
+            return
+        job.present = True
+
+        if job.headers:
+            logging.info('%s has been updated', job.filename)
+            refreshed.append(time.time())
+
+        if state is not None:
+            try:
+                state.record_file(job.url, job.filename,
+                                  response.headers if response else None)
+            except OSError as e:
+                # it will only be looked up on disk next time
+                logging.warn('Could not record %s: %s', job.filename, e)
+
+    if jobs_to_get and downloader.supports_batch:
+        # let the external downloader handle the whole list in one go
+        downloader.download_batch(jobs_to_get, jobs)
+        for job in jobs_to_get:
+            if os.path.exists(job.filename):
+                job.present = True
+                if state is not None:
+                    state.record_file(job.url, job.filename)
+    elif jobs_to_get:
+        plan.start()
+        scheduler = DownloadScheduler(downloader, jobs, jobs_per_host,
+                                      on_complete=record_download)
+        scheduler.run(jobs_to_get)
+        scheduler.report()
+
+        if missing_cache is not None:
+            failed = dict((job.url, error) for job, error in scheduler.failed)
+            for job in jobs_to_get:
+                if job.url in failed:
+                    missing_cache.record_failure(
+                        job.url, failed[job.url].status_code)
+                else:
+                    missing_cache.delete(job.url)
+            missing_cache.save()
+
+    for sec in plan.directories:
+        # After fetching resources, create a playlist in M3U format with
+        # all the videos of the section, including those left out by the
+        # filters of this run, in lecture order.
+        if playlist:
+            videos = section_videos(sec)
+            if videos:
+                write_playlist(sec, videos)
 
         if hooks:
             for hook in hooks:
                 logging.info('Running hook %s for section %s.', hook, sec)
-                os.chdir(sec)
-                subprocess.call(hook)
+                subprocess.call(hook, cwd=sec)
+
+    last_update = max([last_update] + refreshed)
 
     # if we haven't updated any files in 1 month, we're probably
     # done with this course
@@ -433,6 +847,51 @@ def download_lectures(downloader,
     return False
 
 
+def section_videos(directory):
+    """
+    Return the videos present in a section directory, sorted by the
+    numbers their names start with.
+    """
+    def lecture_order(name):
+        prefix = re.match(r'[\d_]*', name).group()
+        return [int(num) for num in re.findall(r'\d+', prefix)], name
+
+    names = [name for name in scan_directory(directory)
+             if name.endswith('.mp4')]
+    return [os.path.join(directory, name)
+            for name in sorted(names, key=lecture_order)]
+
+
+def write_playlist(directory, videos):
+    """
+    Write the M3U playlist of the given videos in directory, named after
+    it, with paths relative to it.
+    """
+    m3u_name = os.path.join(directory,
+                            os.path.basename(directory) + '.m3u')
+    tmp_name = m3u_name + '.tmp'
+    with open(tmp_name, 'w') as m3u:
+        for video in videos:
+            m3u.write(os.path.relpath(video, directory) + '\n')
+    replace_file(tmp_name, m3u_name)
+
+
+def get_conditional_headers(record, mtime):
+    """
+    Return the headers to ask for a resource only if it has changed since
+    it was downloaded, given its DownloadState record (if any) and the
+    modification time of the local file.
+    """
+    headers = {}
+    if record is not None and record.etag:
+        headers['If-None-Match'] = record.etag
+    if record is not None and record.last_modified:
+        headers['If-Modified-Since'] = record.last_modified
+    else:
+        headers['If-Modified-Since'] = formatdate(mtime, usegmt=True)
+    return headers
+
+
 def total_seconds(td):
     """
     Compute total seconds for a timedelta.
@@ -559,6 +1018,20 @@ def parseArgs():
                         default=None,
                         help='use axel for downloading,'
                              ' optionally specify axel bin')
+    parser.add_argument('--segments',
+                        dest='segments',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='number of connections used to download a large'
+                             ' file with the native downloader (default: 1)')
+    parser.add_argument('--min-split-size',
+                        dest='min_split_size',
+                        action='store',
+                        type=int,
+                        default=20,
+                        help='minimum size in MiB of each segment when'
+                             ' using --segments (default: 20)')
     # We keep the wget_bin, ... options for backwards compatibility.
     parser.add_argument('-w',
                         '--wget_bin',
@@ -581,6 +1054,28 @@ def parseArgs():
                         action='store',
                         default=None,
                         help='DEPRECATED, use --axel')
+    parser.add_argument('-j',
+                        '--jobs',
+                        dest='jobs',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='number of files to download at the same time'
+                             ' (default: 1)')
+    parser.add_argument('--jobs-per-host',
+                        dest='jobs_per_host',
+                        action='store',
+                        type=int,
+                        default=None,
+                        help='maximum number of simultaneous downloads from'
+                             ' the same host (default: no limit)')
+    parser.add_argument('--resolve-jobs',
+                        dest='resolve_jobs',
+                        action='store',
+                        type=int,
+                        default=4,
+                        help='number of preview and hidden video pages to'
+                             ' fetch at the same time (default: 4)')
     parser.add_argument('-o',
                         '--overwrite',
                         dest='overwrite',
@@ -588,11 +1083,76 @@ def parseArgs():
                         default=False,
                         help='whether existing files should be overwritten'
                              ' (default: False)')
+    parser.add_argument('--missing-ttl',
+                        dest='missing_ttl',
+                        action='store',
+                        type=int,
+                        default=7,
+                        help='days during which resources that were not'
+                             ' found (404) are not tried again (default: 7)')
+    parser.add_argument('--recheck-missing',
+                        dest='recheck_missing',
+                        action='store_true',
+                        default=False,
+                        help='try again the resources that were not found'
+                             ' on previous runs')
+    parser.add_argument('--verify-fs',
+                        dest='verify_fs',
+                        action='store_true',
+                        default=False,
+                        help='check the files recorded as downloaded against'
+                             ' the disk, and download again the missing ones')
+    parser.add_argument('--refresh',
+                        dest='refresh',
+                        action='store_true',
+                        default=False,
+                        help='check whether the files already downloaded'
+                             ' have changed and download them again if so'
+                             ' (only with the native downloader)')
+    parser.add_argument('--order',
+                        dest='order',
+                        choices=DownloadPlan.ORDERS,
+                        default=None,
+                        help='download the largest or the smallest files'
+                             ' first, after asking their sizes with HEAD'
+                             ' requests (default: syllabus order)')
+    parser.add_argument('--plan-only',
+                        dest='plan_only',
+                        action='store_true',
+                        default=False,
+                        help='do not download anything, print the download'
+                             ' plan of each class as a line of JSON instead')
     parser.add_argument('-l',
                         '--process_local_page',
                         dest='local_page',
                         help='uses or creates local cached version of syllabus'
                              ' page')
+    parser.add_argument('--page-cache-ttl',
+                        dest='page_cache_ttl',
+                        action='store',
+                        type=int,
+                        default=60,
+                        help='minutes during which downloaded pages are used'
+                             ' without checking them again (default: 60)')
+    parser.add_argument('--no-page-cache',
+                        dest='no_page_cache',
+                        action='store_true',
+                        default=False,
+                        help='do not cache the downloaded pages')
+    parser.add_argument('--no-parse-cache',
+                        dest='no_parse_cache',
+                        action='store_true',
+                        default=False,
+                        help='parse the syllabus again even if it has not'
+                             ' changed since the last run')
+    parser.add_argument('--video-cache-ttl',
+                        dest='video_cache_ttl',
+                        action='store',
+                        type=int,
+                        default=24,
+                        help='hours during which the video URLs found on'
+                             ' preview and hidden video pages are reused'
+                             ' (default: 24, 0 to disable)')
     parser.add_argument('--skip-download',
                         dest='skip_download',
                         action='store_true',
@@ -650,12 +1210,42 @@ def parseArgs():
                         dest='clear_cache',
                         action='store_true',
                         default=False,
-                        help='clear cached cookies')
+                        help='clear cached cookies and pages')
     parser.add_argument('--unrestricted-filenames',
                         dest='intact_fnames',
                         action='store_true',
                         default=False,
                         help='Do not limit filenames to be ASCII-only')
+    parser.add_argument('--parser',
+                        dest='parser',
+                        choices=['soup', 'fast'],
+                        default='soup',
+                        help='how to parse the syllabus page: with'
+                             ' BeautifulSoup, or with a faster extractor'
+                             ' (default: soup)')
+    parser.add_argument('--parse-processes',
+                        dest='parse_processes',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='with several classes, get all the syllabi'
+                             ' first and parse them in this many processes'
+                             ' (default: 1)')
+    parser.add_argument('--classes-ahead',
+                        dest='classes_ahead',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='with several classes, number of classes'
+                             ' whose syllabus is fetched and parsed while'
+                             ' downloading the current one (default: 1)')
+    parser.add_argument('--html-parser',
+                        dest='html_parser',
+                        choices=sorted(SOUP_PARSERS),
+                        default=None,
+                        help='tree builder used by BeautifulSoup (default:'
+                             ' $COURSERA_DL_HTML_PARSER, or html5lib if'
+                             ' installed, or html.parser)')
 
     args = parser.parse_args()
 
@@ -681,6 +1271,32 @@ def parseArgs():
             sys.exit(1)
 
     # check arguments
+    try:
+        set_soup_parser(args.html_parser)
+        get_soup_parser()  # check the environment as well
+    except ValueError as e:
+        logging.error(e)
+        sys.exit(1)
+
+    if args.jobs < 1 or args.resolve_jobs < 1 or args.parse_processes < 1:
+        logging.error('The number of jobs must be at least 1')
+        sys.exit(1)
+
+    if args.classes_ahead < 0:
+        logging.error('The number of classes ahead cannot be negative')
+        sys.exit(1)
+
+    if args.refresh and any(getattr(args, bin)
+                            for bin in ['wget', 'curl', 'aria2', 'axel']):
+        logging.error('The --refresh option only works with the native'
+                      ' downloader')
+        sys.exit(1)
+
+    if args.segments < 1 or args.min_split_size < 1:
+        logging.error('The number of segments and the minimum split size'
+                      ' must be at least 1')
+        sys.exit(1)
+
     if args.cookies_file and not os.path.exists(args.cookies_file):
         logging.error('Cookies file not found: %s', args.cookies_file)
         sys.exit(1)
@@ -697,60 +1313,225 @@ def parseArgs():
     return args
 
 
-def download_class(args, class_name):
+def open_class(args, class_name, account=None):
     """
-    Download all requested resources from the class given in class_name.
-    Returns True if the class appears completed.
+    Create the session of the class given in class_name, authenticate and
+    get the syllabus page.  Returns the session and the page.
+
+    The cookies come from the Account shared by the classes if it is
+    given, otherwise from the cookies file or the cookie cache.
     """
 
-    session = requests.Session()
+    session = create_session()
+
+    if not args.no_page_cache:
+        session.page_cache = PageCache(PATH_PAGE_CACHE,
+                                       args.page_cache_ttl * 60)
+
+    if not args.no_parse_cache:
+        session.parse_cache = ParseCache(PATH_PARSE_CACHE)
+
+    session.video_cache = VideoCache(PATH_VIDEO_CACHE,
+                                     args.video_cache_ttl * 3600)
 
     if args.preview:
         # Todo, remove this.
         session.cookie_values = 'dummy=dummy'
     else:
-        get_cookies_for_class(
-            session,
-            class_name,
-            cookies_file=args.cookies_file,
-            username=args.username, password=args.password
-        )
+        if account is not None:
+            account.authenticate(session, class_name)
+        else:
+            get_cookies_for_class(
+                session,
+                class_name,
+                cookies_file=args.cookies_file,
+                username=args.username, password=args.password
+            )
         session.cookie_values = make_cookie_values(session.cookies, class_name)
 
     # get the syllabus listing
     page = get_syllabus(session, class_name, args.local_page, args.preview)
 
+    return session, page
+
+
+def prepare_class(args, class_name, account=None):
+    """
+    Open the class given in class_name (see open_class) and parse its
+    syllabus.  Returns the session, the syllabus page and the sections.
+    """
+
+    logging.info('Getting the syllabus of class: %s', class_name)
+    session, page = open_class(args, class_name, account)
+    sections = parse_syllabi([page], args.intact_fnames, args.parser,
+                             cache=getattr(session, 'parse_cache', None))[0]
+    return session, page, sections
+
+
+def iter_classes(args, account=None):
+    """
+    Generate (class_name, opened) for each class given on the command line,
+    where opened is a function returning the session, syllabus page and
+    sections of the class, or raising one of the CLASS_ERRORS.
+
+    The next args.classes_ahead classes are opened and parsed in the
+    background while the current one is handled, unless all the syllabi
+    are parsed beforehand in args.parse_processes processes.
+    """
+
+    if args.parse_processes > 1 and len(args.class_names) > 1:
+        opened = open_classes(args, account)
+        for class_name in args.class_names:
+            # the classes which could not be opened have been reported
+            if class_name in opened:
+                yield class_name, functools.partial(opened.get, class_name)
+        return
+
+    for item in lookahead_map(
+            functools.partial(prepare_class, args, account=account),
+            args.class_names, args.classes_ahead):
+        yield item
+
+
+def open_classes(args, account=None):
+    """
+    Open all the classes given on the command line, and parse their
+    syllabi in up to args.parse_processes processes.  Returns a dictionary
+    mapping the name of each class which could be opened to its session,
+    syllabus page and sections.
+    """
+
+    opened = []
+    for class_name in args.class_names:
+        try:
+            logging.info('Getting the syllabus of class: %s', class_name)
+            opened.append((class_name,) +
+                          open_class(args, class_name, account))
+        except CLASS_ERRORS as e:
+            log_class_error(e)
+
+    cache = None if args.no_parse_cache else ParseCache(PATH_PARSE_CACHE)
+    parsed = parse_syllabi([page for (_, _, page) in opened],
+                           args.intact_fnames, args.parser,
+                           args.parse_processes, cache)
+
+    return dict((class_name, (session, page, sections))
+                for ((class_name, session, page), sections)
+                in zip(opened, parsed))
+
+
+def download_class(args, class_name, session=None, page=None, parsed=None):
+    """
+    Download all requested resources from the class given in class_name.
+    The session and the syllabus page come from open_class, unless they
+    are given along with the parsed sections (see open_classes).
+    Returns True if the class appears completed.
+    """
+
+    if session is None:
+        session, page = open_class(args, class_name)
+
     # parse it
     sections = parse_syllabus(session, page, args.reverse,
-                              args.intact_fnames)
+                              args.intact_fnames, args.resolve_jobs,
+                              lazy=True, parser=args.parser, parsed=parsed)
+
+    missing_cache = MissingCache(PATH_MISSING_CACHE,
+                                 args.missing_ttl * 24 * 3600,
+                                 args.recheck_missing)
+
+    if args.plan_only:
+        # a dry run: nothing is written under args.path, so there is no
+        # download state and the files on disk are checked directly
+        try:
+            plan = plan_lectures(
+                class_name,
+                sections,
+                args.file_formats,
+                args.overwrite,
+                args.section_filter,
+                args.lecture_filter,
+                args.resource_filter,
+                args.path,
+                args.verbose_dirs,
+                args.combined_section_lectures_nums,
+                missing_cache,
+                None,
+                args.refresh,
+                session,
+                args.resolve_jobs)
+            plan.estimate_sizes(session, args.jobs)
+        finally:
+            session.video_cache.save()
+
+        description = plan.as_dict()
+        description['class'] = class_name
+        print(json.dumps(description))
+        return False
 
     if args.about:
         download_about(session, class_name, args.path, args.overwrite)
 
     downloader = get_downloader(session, class_name, args)
 
+    state = DownloadState(os.path.join(args.path, class_name))
+    if args.verify_fs:
+        forgotten = state.verify()
+        logging.info('%d files to download again after checking the disk',
+                     forgotten)
+
     # obtain the resources
-    completed = download_lectures(
-        downloader,
-        class_name,
-        sections,
-        args.file_formats,
-        args.overwrite,
-        args.skip_download,
-        args.section_filter,
-        args.lecture_filter,
-        args.resource_filter,
-        args.path,
-        args.verbose_dirs,
-        args.preview,
-        args.combined_section_lectures_nums,
-        args.hooks,
-        args.playlist,
-        args.intact_fnames)
+    try:
+        completed = download_lectures(
+            downloader,
+            class_name,
+            sections,
+            args.file_formats,
+            args.overwrite,
+            args.skip_download,
+            args.section_filter,
+            args.lecture_filter,
+            args.resource_filter,
+            args.path,
+            args.verbose_dirs,
+            args.preview,
+            args.combined_section_lectures_nums,
+            args.hooks,
+            args.playlist,
+            args.intact_fnames,
+            args.jobs,
+            args.jobs_per_host,
+            missing_cache,
+            state,
+            args.refresh,
+            session,
+            args.resolve_jobs,
+            args.order)
+    finally:
+        # commit what has been recorded, even if interrupted
+        state.close()
+        session.video_cache.save()
 
     return completed
 
 
+# errors which prevent a class from being downloaded, but not the others
+CLASS_ERRORS = (requests.exceptions.HTTPError, ClassNotFound,
+                AuthenticationFailed)
+
+
+def log_class_error(error):
+    """
+    Log one of the CLASS_ERRORS.
+    """
+    if isinstance(error, ClassNotFound):
+        logging.error('Could not find class: %s', error)
+    elif isinstance(error, AuthenticationFailed):
+        logging.error('Could not authenticate: %s', error)
+    else:
+        logging.error('HTTPError %s', error)
+
+
 def main():
     """
     Main entry point for execution as a program (instead of as a module).
@@ -763,17 +1544,27 @@ def main():
     if args.clear_cache:
         shutil.rmtree(PATH_CACHE)
 
-    for class_name in args.class_names:
-        try:
-            logging.info('Downloading class: %s', class_name)
-            if download_class(args, class_name):
-                completed_classes.append(class_name)
-        except requests.exceptions.HTTPError as e:
-            logging.error('HTTPError %s', e)
-        except ClassNotFound as cnf:
-            logging.error('Could not find class: %s', cnf)
-        except AuthenticationFailed as af:
-            logging.error('Could not authenticate: %s', af)
+    # keep enough connections alive for all the simultaneous transfers
+    configure_pool(args.jobs * args.segments)
+
+    # log in once for all the classes
+    account = None
+    if not (args.preview or args.cookies_file):
+        account = Account(args.username, args.password)
+
+    try:
+        for class_name, opened in iter_classes(args, account):
+            try:
+                session, page, sections = opened()
+                logging.info('Downloading class: %s', class_name)
+                if download_class(args, class_name, session, page,
+                                  sections):
+                    completed_classes.append(class_name)
+            except CLASS_ERRORS as e:
+                log_class_error(e)
+    finally:
+        if account is not None:
+            account.save()
 
     if completed_classes:
         logging.info(
@@ -25,3 +25,7 @@ else:
 
 PATH_CACHE = os.path.join(tempfile.gettempdir(), user+"_coursera_dl_cache")
 PATH_COOKIES = os.path.join(PATH_CACHE, 'cookies')
+PATH_MISSING_CACHE = os.path.join(PATH_CACHE, 'missing.json')
+PATH_PAGE_CACHE = os.path.join(PATH_CACHE, 'pages')
+PATH_PARSE_CACHE = os.path.join(PATH_CACHE, 'syllabi')
+PATH_VIDEO_CACHE = os.path.join(PATH_CACHE, 'videos.json')
@@ -2,16 +2,45 @@
 
 from __future__ import print_function
 
+import io
 import logging
 import math
 import os
+import re
 import requests
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 
+from requests.packages.urllib3.exceptions import \
+    HTTPError as Urllib3HTTPError
+import six
 from six import iteritems
 
+from .utils import get_file_size, replace_file
+
+
+class DownloadError(Exception):
+    """
+    Raised when a download fails in a way that may be fixed by retrying.
+
+    :param status_code: HTTP status code, if the server answered.
+    :param retry_after: Value of the Retry-After header, if any.
+    """
+
+    def __init__(self, msg, status_code=None, retry_after=None):
+        Exception.__init__(self, msg)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+# errors of a request or of reading its response, which may be fixed by
+# retrying; the socket errors are IOErrors
+NETWORK_ERRORS = (requests.exceptions.RequestException, IOError,
+                  Urllib3HTTPError)
+
 
 class Downloader(object):
     """
@@ -29,19 +58,44 @@ class Downloader(object):
     def _start_download(self, url, filename):
         """
         Actual method to download the given url to the given file.
-        This method should be implemented by the subclass.
+        This method should be implemented by the subclass, and may return
+        the HTTP response it got for the file.
         """
         raise NotImplementedError("Subclasses should implement this")
 
-    def download(self, url, filename):
+    # Whether partially downloaded files are kept to resume them later.
+    resumable = False
+
+    # Whether a whole list of files can be handed over at once with
+    # download_batch.
+    supports_batch = False
+
+    # Whether extra HTTP headers can be passed to download, and a 304 Not
+    # Modified answer is reported instead of overwriting the file.
+    supports_headers = False
+
+    def download(self, url, filename, headers=None):
         """
         Download the given url to the given file. When the download
-        is aborted by the user, the partially downloaded file is also removed.
+        is aborted by the user, the partially downloaded file is also removed,
+        unless the downloader is able to resume it.
+
+        Extra HTTP headers (e.g. for conditional requests) can only be given
+        if the downloader supports_headers.
+
+        Returns the HTTP response of the download if the downloader has
+        access to it, None otherwise.
         """
 
         try:
-            self._start_download(url, filename)
+            if headers:
+                return self._start_download(url, filename, headers)
+            return self._start_download(url, filename)
         except KeyboardInterrupt as e:
+            if self.resumable:
+                logging.info(
+                    'Keyboard Interrupt -- Keeping partial file: %s', filename)
+                raise e
             logging.info(
                 'Keyboard Interrupt -- Removing partial file: %s', filename)
             try:
@@ -50,6 +104,14 @@ class Downloader(object):
                 pass
             raise e
 
+    def download_batch(self, jobs, parallel=1):
+        """
+        Download all the given jobs (objects with url and filename
+        attributes), running up to parallel transfers at once.
+        Only available when supports_batch is set.
+        """
+        raise NotImplementedError("Subclasses should implement this")
+
 
 class ExternalDownloader(Downloader):
     """
@@ -72,17 +134,23 @@ class ExternalDownloader(Downloader):
         if not self.bin:
             raise RuntimeError("No bin specified")
 
-    def _prepare_cookies(self, command, url):
+    def _get_cookie_values(self, url):
         """
-        Extract cookies from the requests session and add them to the command
+        Return the Cookie header value the session would send to the url.
         """
 
         req = requests.models.Request()
         req.method = 'GET'
         req.url = url
 
-        cookie_values = requests.cookies.get_cookie_header(
-            self.session.cookies, req)
+        return requests.cookies.get_cookie_header(self.session.cookies, req)
+
+    def _prepare_cookies(self, command, url):
+        """
+        Extract cookies from the requests session and add them to the command
+        """
+
+        cookie_values = self._get_cookie_values(url)
 
         if cookie_values:
             self._add_cookies(command, cookie_values)
@@ -111,6 +179,40 @@ class ExternalDownloader(Downloader):
                 e, self.bin)
             raise OSError(msg)
 
+    def _create_batch_input(self, jobs):
+        """
+        Create the contents of the input file listing all the jobs.
+        """
+        raise NotImplementedError("Subclasses should implement this")
+
+    def _create_batch_command(self, input_filename, parallel):
+        """
+        Create command to download all the files listed in input_filename.
+        """
+        raise NotImplementedError("Subclasses should implement this")
+
+    def download_batch(self, jobs, parallel=1):
+        if not jobs:
+            return
+
+        fd, input_filename = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        try:
+            with io.open(input_filename, 'w', encoding='utf-8') as f:
+                f.write(self._create_batch_input(jobs))
+
+            command = self._create_batch_command(input_filename, parallel)
+            logging.info('Downloading %d files with %s', len(jobs), self.bin)
+            logging.debug('Executing %s: %s', self.bin, command)
+            try:
+                subprocess.call(command)
+            except OSError as e:
+                msg = "{0}. Are you sure that '{1}' is the right bin?".format(
+                    e, self.bin)
+                raise OSError(msg)
+        finally:
+            os.remove(input_filename)
+
 
 class WgetDownloader(ExternalDownloader):
     """
@@ -130,9 +232,11 @@ class WgetDownloader(ExternalDownloader):
 class CurlDownloader(ExternalDownloader):
     """
     Uses curl, which is robust and gives nice visual feedback.
+    Several files are downloaded with a single curl config file.
     """
 
     bin = 'curl'
+    supports_batch = True
 
     def _add_cookies(self, command, cookie_values):
         command.extend(['--cookie', cookie_values])
@@ -140,14 +244,42 @@ class CurlDownloader(ExternalDownloader):
     def _create_command(self, url, filename):
         return [self.bin, url, '-k', '-#', '-L', '-o', filename]
 
+    def _create_batch_input(self, jobs):
+        def quote(value):
+            value = value.replace('\\', '\\\\').replace('"', '\\"')
+            return '"' + value + '"'
+
+        groups = []
+        for job in jobs:
+            lines = ['url = ' + quote(job.url),
+                     'output = ' + quote(job.filename),
+                     'insecure',
+                     'location']
+            cookie_values = self._get_cookie_values(job.url)
+            if cookie_values:
+                lines.append('cookie = ' + quote(cookie_values))
+            groups.append('\n'.join(lines) + '\n')
+
+        # 'next' resets the per-url options between each group
+        return six.u('next\n').join(groups)
+
+    def _create_batch_command(self, input_filename, parallel):
+        command = [self.bin, '-#', '-K', input_filename]
+        if parallel > 1:
+            # Available since curl 7.66
+            command[1:1] = ['--parallel', '--parallel-max', str(parallel)]
+        return command
+
 
 class Aria2Downloader(ExternalDownloader):
     """
     Uses aria2. Unfortunately, it does not give a nice visual feedback, but
     gets the job done much faster than the alternatives.
+    Several files are downloaded with a single aria2 input file.
     """
 
     bin = 'aria2c'
+    supports_batch = True
 
     def _add_cookies(self, command, cookie_values):
         command.extend(['--header', "Cookie: " + cookie_values])
@@ -157,6 +289,25 @@ class Aria2Downloader(ExternalDownloader):
                 '--check-certificate=false', '--log-level=notice',
                 '--max-connection-per-server=4', '--min-split-size=1M']
 
+    def _create_batch_input(self, jobs):
+        lines = []
+        for job in jobs:
+            dirname, basename = os.path.split(job.filename)
+            lines.extend([job.url,
+                          '  dir=' + (dirname or '.'),
+                          '  out=' + basename,
+                          # we have already decided that it must be fetched
+                          '  allow-overwrite=true'])
+            cookie_values = self._get_cookie_values(job.url)
+            if cookie_values:
+                lines.append('  header=Cookie: ' + cookie_values)
+        return six.u('\n').join(lines) + six.u('\n')
+
+    def _create_batch_command(self, input_filename, parallel):
+        return [self.bin, '-i', input_filename, '-j', str(parallel),
+                '--check-certificate=false', '--log-level=notice',
+                '--max-connection-per-server=4', '--min-split-size=1M']
+
 
 class AxelDownloader(ExternalDownloader):
     """
@@ -195,9 +346,11 @@ class DownloadProgress(object):
     """
     Report download progress.
     Inspired by https://github.com/rg3/youtube-dl
+
+    With `quiet`, the progress is tracked but not printed.
     """
 
-    def __init__(self, total):
+    def __init__(self, total, quiet=False):
         if total in [0, '0', None]:
             self._total = None
         else:
@@ -208,6 +361,8 @@ class DownloadProgress(object):
         self._now = 0
 
         self._finished = False
+        self._quiet = quiet
+        self._lock = threading.Lock()
 
     def start(self):
         self._now = time.time()
@@ -220,9 +375,10 @@ class DownloadProgress(object):
         self.report_progress()
 
     def read(self, bytes):
-        self._now = time.time()
-        self._current += bytes
-        self.report_progress()
+        with self._lock:
+            self._now = time.time()
+            self._current += bytes
+            self.report_progress()
 
     def calc_percent(self):
         if self._total is None:
@@ -239,6 +395,9 @@ class DownloadProgress(object):
 
     def report_progress(self):
         """Report download progress."""
+        if self._quiet:
+            return
+
         percent = self.calc_percent()
         total = format_bytes(self._total)
 
@@ -258,56 +417,284 @@ class NativeDownloader(Downloader):
     """
     'Native' python downloader -- slower than the external downloaders.
 
+    Each call makes a single attempt and raises DownloadError when it fails;
+    retrying is left to the caller (see scheduler.DownloadScheduler).
+    Interrupted downloads are resumed with HTTP Range requests when the
+    server supports them.  Large files can also be fetched in several
+    segments at the same time.
+
     :param session: Requests session.
+    :param segments: Maximum number of connections used for one file.
+    :param min_split_size: Files are only split in segments of at least
+        this many bytes.
+    :param show_progress: Whether to print the progress of each download;
+        the progress lines of simultaneous downloads would overwrite each
+        other.
     """
 
-    def __init__(self, session):
+    resumable = True
+    supports_headers = True
+
+    def __init__(self, session, segments=1, min_split_size=20 * 1024 * 1024,
+                 show_progress=True):
         self.session = session
+        self.segments = segments
+        self.min_split_size = min_split_size
+        self.show_progress = show_progress
 
-    def _start_download(self, url, filename):
-        logging.info('Downloading %s -> %s', url, filename)
+    def _get_segments(self, url):
+        """
+        Return the HEAD response of the url and the byte ranges to download
+        it in segments, or None if the file should be downloaded in one
+        piece.
+        """
+        try:
+            r = self.session.head(url, allow_redirects=True)
+            r.close()
+        except requests.exceptions.RequestException:
+            return None
+
+        if r.status_code != 200 or \
+                r.headers.get('accept-ranges') != 'bytes':
+            return None
+
+        try:
+            size = int(r.headers.get('content-length'))
+        except (TypeError, ValueError):
+            return None
+
+        count = min(self.segments, size // max(1, self.min_split_size))
+        if count < 2:
+            return None
+
+        segment_size = size // count
+        ranges = [(i * segment_size, (i + 1) * segment_size - 1)
+                  for i in range(count)]
+        ranges[-1] = (ranges[-1][0], size - 1)
+
+        return r, ranges
+
+    def _download_segment(self, url, filename, start, end, progress, errors):
+        try:
+            headers = {'Range': 'bytes={0}-{1}'.format(start, end)}
+            r = self.session.get(url, stream=True, headers=headers)
+            if r.status_code != 206:
+                r.close()
+                raise IOError('HTTP Error {0} for segment {1}-{2}'.format(
+                    r.status_code, start, end))
 
-        attempts_count = 0
-        error_msg = ''
-        while attempts_count < 5:
-            r = self.session.get(url, stream=True)
-
-            if r.status_code is not 200:
-                logging.warn(
-                    'Probably the file is missing from the AWS repository...'
-                    ' waiting.')
-
-                if r.reason:
-                    error_msg = r.reason + ' ' + str(r.status_code)
-                else:
-                    error_msg = 'HTTP Error ' + str(r.status_code)
-
-                wait_interval = 2 ** (attempts_count + 1)
-                msg = 'Error downloading, will retry in {0} seconds ...'
-                print(msg.format(wait_interval))
-                time.sleep(wait_interval)
-                attempts_count += 1
-                continue
-
-            content_length = r.headers.get('content-length')
-            progress = DownloadProgress(content_length)
             chunk_sz = 1048576
-            with open(filename, 'wb') as f:
-                progress.start()
+            with open(filename, 'r+b') as f:
+                f.seek(start)
                 while True:
                     data = r.raw.read(chunk_sz)
+                    if not data:
+                        break
+                    f.write(data)
+                    progress.read(len(data))
+
+                if f.tell() != end + 1:
+                    raise IOError('Incomplete segment {0}-{1}'.format(
+                        start, end))
+            r.close()
+        except Exception as e:
+            errors.append(e)
+
+    def _segmented_download(self, url, part_filename, ranges):
+        """
+        Download the byte ranges in parallel, each one written at its
+        offset of a preallocated file.  Returns True on success.
+        """
+        size = ranges[-1][1] + 1
+        logging.info('Downloading in %d segments', len(ranges))
+
+        with open(part_filename, 'wb') as f:
+            f.truncate(size)
+
+        progress = DownloadProgress(size, quiet=not self.show_progress)
+        progress.start()
+        errors = []
+
+        threads = []
+        for start, end in ranges:
+            t = threading.Thread(
+                target=self._download_segment,
+                args=(url, part_filename, start, end, progress, errors))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        try:
+            for t in threads:
+                while t.is_alive():
+                    t.join(0.5)
+        finally:
+            if errors or any(t.is_alive() for t in threads):
+                # The preallocated file cannot be resumed with a simple
+                # Range request, so we must not leave it behind.
+                try:
+                    os.remove(part_filename)
+                except OSError:
+                    pass
+
+        if errors:
+            logging.warn('Segmented download failed (%s), falling back to'
+                         ' a single connection.', errors[0])
+            return False
+
+        progress.stop()
+        return True
+
+    def _start_download(self, url, filename, headers=None):
+        logging.info('Downloading %s -> %s', url, filename)
+
+        # The data is streamed into a sidecar file that is only renamed to
+        # the final name once complete, so that an interrupted download can
+        # be resumed later, even by another process.
+        part_filename = filename + '.part'
+
+        if self.segments > 1 and not headers and \
+                not os.path.exists(part_filename):
+            segments = self._get_segments(url)
+            if segments and self._segmented_download(
+                    segments[0].url, part_filename, segments[1]):
+                replace_file(part_filename, filename)
+                return segments[0]
+
+        request_headers = dict(headers or {})
+        resume_from = get_file_size(part_filename)
+        if resume_from:
+            request_headers['Range'] = 'bytes={0}-'.format(resume_from)
+            # only resume if the file has not changed in the meantime
+            validator = _load_validator(part_filename)
+            if validator:
+                request_headers['If-Range'] = validator
+
+        try:
+            r = self.session.get(url, stream=True, headers=request_headers)
+        except NETWORK_ERRORS as e:
+            raise DownloadError(str(e))
+
+        if resume_from and (
+                r.status_code == 416 or
+                (r.status_code == 206 and
+                 get_range_start(r.headers) != resume_from)):
+            logging.info('Cannot resume %s, starting over.', filename)
+            r.close()
+            _remove_part_file(part_filename)
+            return self._start_download(url, filename, headers)
+
+        if r.status_code == 304:
+            # the file did not change, and any partial file is outdated
+            r.close()
+            if resume_from:
+                _remove_part_file(part_filename)
+            return r
+
+        if r.status_code not in (200, 206):
+            if r.reason:
+                error_msg = r.reason + ' ' + str(r.status_code)
+            else:
+                error_msg = 'HTTP Error ' + str(r.status_code)
+            r.close()
+            raise DownloadError(error_msg, r.status_code,
+                                r.headers.get('retry-after'))
+
+        if r.status_code == 206:
+            logging.info('Resuming download from byte %d', resume_from)
+            mode = 'ab'
+        else:
+            # the server ignored the Range header, or the file changed
+            mode = 'wb'
+            _store_validator(part_filename, r.headers)
+
+        content_length = r.headers.get('content-length')
+        progress = DownloadProgress(content_length,
+                                    quiet=not self.show_progress)
+        chunk_sz = 1048576
+        try:
+            with open(part_filename, mode) as f:
+                progress.start()
+                while True:
+                    data = read_response(r, chunk_sz)
                     if not data:
                         progress.stop()
                         break
                     progress.read(len(data))
                     f.write(data)
+        finally:
             r.close()
-            return True
 
-        if attempts_count == 5:
-            logging.warn('Skipping, can\'t download file ...')
-            logging.error(error_msg)
-            return False
+        replace_file(part_filename, filename)
+        _remove_validator(part_filename)
+        return r
+
+
+def read_response(response, size):
+    """
+    Read up to size bytes of the body of a streamed response.  Network
+    errors are raised as DownloadError; whatever was written so far is
+    kept in the .part file, so that a retry only fetches the missing bytes.
+    """
+    try:
+        return response.raw.read(size)
+    except NETWORK_ERRORS as e:
+        raise DownloadError(str(e))
+
+
+def get_range_start(headers):
+    """
+    Return the first byte of the Content-Range of a 206 response, or None.
+    """
+    match = re.match(r'bytes\s+(\d+)-', headers.get('content-range', ''))
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+def _validator_filename(part_filename):
+    return part_filename + '.validator'
+
+
+def _load_validator(part_filename):
+    """
+    Return the validator (ETag or Last-Modified) of the file being
+    downloaded in part_filename, or None.
+    """
+    try:
+        with open(_validator_filename(part_filename)) as f:
+            return f.read().strip() or None
+    except IOError:
+        return None
+
+
+def _store_validator(part_filename, headers):
+    """
+    Remember the validator of the file about to be written in
+    part_filename, for the If-Range header of a later resume.  Weak ETags
+    cannot be used with If-Range.
+    """
+    validator = headers.get('etag')
+    if not validator or validator.startswith('W/'):
+        validator = headers.get('last-modified')
+
+    if validator:
+        with open(_validator_filename(part_filename), 'w') as f:
+            f.write(validator)
+    else:
+        _remove_validator(part_filename)
+
+
+def _remove_validator(part_filename):
+    try:
+        os.remove(_validator_filename(part_filename))
+    except OSError:
+        pass
+
+
+def _remove_part_file(part_filename):
+    os.remove(part_filename)
+    _remove_validator(part_filename)
 
 
 def get_downloader(session, class_name, args):
@@ -326,4 +713,7 @@ def get_downloader(session, class_name, args):
         if getattr(args, bin):
             return class_(session, bin=getattr(args, bin))
 
-    return NativeDownloader(session)
+    # with several jobs, only the overall progress of the plan is logged
+    return NativeDownloader(session, args.segments,
+                            args.min_split_size * 1024 * 1024,
+                            show_progress=args.jobs <= 1)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module for the data model of a parsed syllabus: sections, made of lectures,
+which have resources of several formats.
+
+The classes are named tuples without instance dictionaries, so that they
+stay small and can still be used as the (name, lectures), (name, resources)
+and (url, title) tuples of the former model.
+"""
+
+from collections import namedtuple
+
+from six import iteritems
+from six.moves import intern
+
+
+class Section(namedtuple('Section', 'name lectures')):
+    """
+    A section (week) of a class.
+
+    :param name: Name of the section, cleaned to be used as a directory
+        name.
+    :param lectures: List of Lecture.
+    """
+
+    __slots__ = ()
+
+    def dirname(self, num, class_name=None):
+        """
+        Return the name of the directory of the section, given its number.
+        The name is prefixed with the class name if it is given.
+        """
+        dirname = '%02d_%s' % (num, self.name)
+        if class_name:
+            dirname = class_name.upper() + '_' + dirname
+        return dirname
+
+
+class Lecture(namedtuple('Lecture', 'name resources')):
+    """
+    A lecture of a section.
+
+    :param name: Name of the lecture, cleaned to be used in filenames.
+    :param resources: Dictionary mapping each format (file extension) to a
+        list of Resource.
+    """
+
+    __slots__ = ()
+
+    def filename(self, num, title, fmt, section_num=None):
+        """
+        Return the name of the file of the resource of the lecture with the
+        given title and format, given the number of the lecture, and of its
+        section to number the file with both.
+        """
+        if title:
+            title = '_' + title
+
+        if section_num is not None:
+            return '%02d_%02d_%s%s.%s' % (section_num, num, self.name,
+                                          title, fmt)
+        return '%02d_%s%s.%s' % (num, self.name, title, fmt)
+
+
+class Resource(namedtuple('Resource', 'url title')):
+    """
+    A resource of a lecture: its URL, and a title which is only used in
+    the filename to tell apart the resources of the same format.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, url, title=''):
+        return super(Resource, cls).__new__(cls, url, title)
+
+
+def _intern(s):
+    try:
+        return intern(s)
+    except TypeError:
+        # only byte strings can be interned with Python 2
+        return s
+
+
+def make_lecture(name, resources):
+    """
+    Return a Lecture, given the dictionary of its resources as lists of
+    (url, title) tuples.  The formats are interned, as they are repeated
+    in every lecture.
+    """
+    return Lecture(name, dict(
+        (_intern(fmt), [Resource(*r) for r in rs])
+        for fmt, rs in iteritems(resources)))
+
+
+def as_tuples(sections):
+    """
+    Return the sections as plain tuples, lists and dictionaries.
+    """
+    return [(section.name, [(lecture.name, dict(
+        (fmt, [(r[0], r[1]) for r in resources])
+        for fmt, resources in iteritems(lecture.resources)))
+        for lecture in section.lectures])
+        for section in sections]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+"""
+This module manages the connection pool shared by all HTTP sessions.
+"""
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+# Number of connections kept alive per host when not configured otherwise.
+DEFAULT_POOL_SIZE = 10
+
+_adapter = None
+
+
+def configure_pool(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Create the shared connection pool, keeping up to pool_size connections
+    alive for each host.  Sessions created before this call keep using the
+    previous pool.
+    """
+    global _adapter
+
+    pool_size = max(pool_size, DEFAULT_POOL_SIZE)
+    _adapter = HTTPAdapter(pool_connections=DEFAULT_POOL_SIZE,
+                           pool_maxsize=pool_size)
+
+
+def get_adapter():
+    """
+    Return the shared transport adapter, creating it if needed.
+    """
+    if _adapter is None:
+        configure_pool()
+    return _adapter
+
+
+def create_session():
+    """
+    Return a new requests session with its own cookie jar, but reusing the
+    connections of the shared pool.  This way we only pay for the TCP and
+    TLS handshakes once per host, while cookies stay isolated per class.
+
+    Note: closing the returned session closes the shared pool too.
+    """
+    session = requests.Session()
+
+    adapter = get_adapter()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module for parsing web pages: choice of the BeautifulSoup tree builder, and
+extraction of the sections and lectures of a syllabus page without building
+a document tree.
+"""
+
+import os
+import re
+import sys
+
+from collections import deque
+
+import six
+from bs4 import BeautifulSoup, SoupStrainer
+from six.moves.html_parser import HTMLParser
+from six.moves.html_entities import name2codepoint
+
+# class of the elements holding the name of a section
+SECTION_HEADER_CLASS = re.compile('^course-item-list-header')
+
+# elements which have no end tag
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+    'link', 'menuitem', 'meta', 'param', 'source', 'track', 'wbr',
+    'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer'])
+
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+# BeautifulSoup tree builders which can be used, with the module they need
+SOUP_PARSERS = {
+    'html5lib': 'html5lib',
+    'lxml': 'lxml',
+    'html.parser': None,
+}
+
+# environment variable choosing the tree builder
+HTML_PARSER_ENV = 'COURSERA_DL_HTML_PARSER'
+
+# only the course item list, with the headers and lists of lectures it
+# contains, is needed from the syllabus page
+SYLLABUS_STRAINER = SoupStrainer(attrs={'class': 'course-item-list'})
+
+_available = {}
+_soup_parser = None
+
+
+def is_available(parser):
+    """
+    Tell whether the given tree builder can be used.
+    """
+    if parser not in SOUP_PARSERS:
+        return False
+
+    if parser not in _available:
+        module = SOUP_PARSERS[parser]
+        try:
+            if module is not None:
+                __import__(module)
+            _available[parser] = True
+        except ImportError:
+            _available[parser] = False
+    return _available[parser]
+
+
+def set_soup_parser(parser):
+    """
+    Choose the tree builder used by make_soup.  None restores the default,
+    see get_soup_parser.  Raises ValueError if it cannot be used.
+    """
+    global _soup_parser
+
+    if parser is not None and not is_available(parser):
+        raise ValueError('HTML parser not available: %s (choose among %s)'
+                         % (parser, ', '.join(sorted(SOUP_PARSERS))))
+    _soup_parser = parser
+
+
+def get_soup_parser():
+    """
+    Return the name of the tree builder to use: the one chosen with
+    set_soup_parser, or in the environment, or else html5lib if it is
+    installed, and html.parser otherwise.
+    """
+    if _soup_parser is not None:
+        return _soup_parser
+
+    parser = os.environ.get(HTML_PARSER_ENV)
+    if parser:
+        if not is_available(parser):
+            raise ValueError('HTML parser not available: %s' % parser)
+        return parser
+
+    if is_available('html5lib'):
+        return 'html5lib'
+    return 'html.parser'
+
+
+def make_soup(page, parse_only=None):
+    """
+    Parse page with BeautifulSoup and the chosen tree builder.  parse_only
+    is a SoupStrainer restricting the elements which are kept; it is not
+    supported by html5lib, which parses the whole page.
+    """
+    parser = get_soup_parser()
+    if parser == 'html5lib':
+        parse_only = None
+    return BeautifulSoup(page, parser, parse_only=parse_only)
+
+
+def _collapse_spaces(text):
+    """
+    Collapse strings made only of ASCII whitespace like BeautifulSoup does.
+    """
+    if text.strip(ASCII_SPACES):
+        return text
+    return '\n' if '\n' in text else ' '
+
+
+class _Element(object):
+    """
+    An element open in the document, with the bookkeeping needed to find
+    its children by position.
+    """
+
+    def __init__(self, tag, role=None):
+        self.tag = tag
+        self.role = role
+        self.item = None
+        self.nodes = 0  # number of child nodes seen so far
+        self.in_text = False  # whether the last child node is text
+        self.capture_node = None  # position of the child text to capture
+        self.captures = []  # lists where the captured text is appended
+
+
+class SyllabusExtractor(HTMLParser):
+    """
+    Event driven extractor of the sections of a syllabus page.
+
+    It finds the same elements as the BeautifulSoup based parser: the
+    section headers (elements with the course-item-list-header class),
+    the list of lectures following each header, and the links of each
+    lecture.  Complete sections are queued in `sections` as tuples::
+
+      (section name, [(lecture name, [link attributes, ...]), ...])
+    """
+
+    def __init__(self):
+        if sys.version_info >= (3, 4):
+            HTMLParser.__init__(self, convert_charrefs=True)
+        elif six.PY3:
+            # the default strict mode fails on malformed pages
+            HTMLParser.__init__(self, strict=False)
+        else:
+            HTMLParser.__init__(self)
+
+        self.sections = deque()
+        self._stack = []
+        self._section = None
+        self._in_header = False
+        self._list_parent = None  # element where the list is expected
+        self._items = []  # open lecture items
+
+    def _add_node(self, is_text=False):
+        if not self._stack:
+            return None
+
+        parent = self._stack[-1]
+        if not (is_text and parent.in_text):
+            parent.nodes += 1
+        parent.in_text = is_text
+        return parent
+
+    def _finish_section(self):
+        if self._section is None:
+            return
+
+        title, lectures = self._section
+        assert title, "couldn't find section"
+
+        result = []
+        for name, links in lectures:
+            assert name, "couldn't get lecture name"
+            result.append((_collapse_spaces(''.join(name)), links))
+
+        self.sections.append((_collapse_spaces(''.join(title)), result))
+        self._section = None
+        self._list_parent = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict((k, v if v is not None else '') for (k, v) in attrs)
+        parent = self._add_node()
+        element = _Element(tag)
+
+        classes = attrs.get('class', '')
+        if not self._in_header and (
+                SECTION_HEADER_CLASS.search(classes) or
+                any(SECTION_HEADER_CLASS.search(c)
+                    for c in classes.split())):
+            self._finish_section()
+            self._section = ([], [])
+            self._in_header = True
+            element.role = 'header'
+
+        elif parent is not None and parent.role == 'header' and \
+                parent.nodes == 1:
+            # the second child of the first element of the header is the
+            # name of the section
+            element.capture_node = 2
+            element.captures.append(self._section[0])
+
+        elif self._list_parent is not None and parent is self._list_parent:
+            # the element following the header holds the lectures
+            self._list_parent = None
+            element.role = 'list'
+
+        elif tag == 'li' and self._section is not None and \
+                any(e.role == 'list' for e in self._stack):
+            # [lecture name, links], the name is set by the first link
+            element.item = [None, []]
+            self._section[1].append(element.item)
+            self._items.append(element.item)
+
+        if tag == 'a':
+            for item in self._items:
+                item[1].append(attrs)
+                if item[0] is None:
+                    # the first child of the first link is the lecture name
+                    item[0] = []
+                    element.capture_node = 1
+                    element.captures.append(item[0])
+
+        self._stack.append(element)
+        if tag in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i].tag == tag:
+                break
+        else:
+            # BeautifulSoup ignores end tags without a start tag
+            return
+
+        while len(self._stack) > i:
+            self._close(self._stack.pop())
+
+    def _close(self, element):
+        if element.role == 'header':
+            self._in_header = False
+            if self._stack:
+                self._list_parent = self._stack[-1]
+            else:
+                self._finish_section()
+        elif element.role == 'list':
+            self._finish_section()
+        elif element.item is not None:
+            self._items.remove(element.item)
+
+        if element is self._list_parent:
+            # no list after the header
+            self._finish_section()
+
+    def handle_data(self, data):
+        parent = self._add_node(is_text=True)
+        if parent is None:
+            return
+
+        if parent.capture_node == parent.nodes:
+            for capture in parent.captures:
+                capture.append(data)
+
+        if self._list_parent is parent and data.strip(ASCII_SPACES):
+            # text where the list was expected
+            self._finish_section()
+
+    def handle_entityref(self, name):
+        # only called when convert_charrefs is not available
+        if name in name2codepoint:
+            self.handle_data(six.unichr(name2codepoint[name]))
+        else:
+            self.handle_data('&%s;' % name)
+
+    def handle_charref(self, name):
+        # only called when convert_charrefs is not available
+        try:
+            if name.lower().startswith('x'):
+                char = six.unichr(int(name[1:], 16))
+            else:
+                char = six.unichr(int(name))
+        except (ValueError, OverflowError):
+            char = '&#%s;' % name
+        self.handle_data(char)
+
+    def handle_comment(self, data):
+        self._add_node()
+
+    def close(self):
+        HTMLParser.close(self)
+        while self._stack:
+            self._close(self._stack.pop())
+        self._finish_section()
+
+
+def extract_sections(page, chunk_size=64 * 1024):
+    """
+    Generate the sections of the syllabus page as they are found, see
+    SyllabusExtractor.
+    """
+    extractor = SyllabusExtractor()
+    for start in range(0, len(page), chunk_size):
+        extractor.feed(page[start:start + chunk_size])
+        while extractor.sections:
+            yield extractor.sections.popleft()
+
+    extractor.close()
+    while extractor.sections:
+        yield extractor.sections.popleft()
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module for running several downloads at the same time.
+"""
+
+import datetime
+import heapq
+import logging
+import random
+import threading
+import time
+
+from collections import deque
+from email.utils import parsedate_tz, mktime_tz
+
+import requests
+
+from .downloaders import DownloadError, format_bytes
+from .utils import get_host, parallel_map
+
+
+class DownloadJob(object):
+    """
+    A single resource to be downloaded.
+
+    :param url: URL of the resource.
+    :param filename: Path where the resource should be saved.
+    :param fmt: File format (extension) of the resource.
+    :param headers: Extra HTTP headers to send with the request.
+    :param present: Whether the file has already been downloaded.
+    """
+
+    def __init__(self, url, filename, fmt=None, headers=None,
+                 present=False):
+        self.url = url
+        self.filename = filename
+        self.fmt = fmt
+        self.headers = headers
+        self.present = present
+        self.size = None
+        self.host = get_host(url)
+        self.attempts = 0
+
+    def __repr__(self):
+        return 'DownloadJob(%r, %r)' % (self.url, self.filename)
+
+    def as_dict(self):
+        return {'url': self.url,
+                'filename': self.filename,
+                'format': self.fmt,
+                'size': self.size,
+                'present': self.present}
+
+
+def get_content_length(session, url):
+    """
+    Return the size announced by a HEAD request on url, or None if it
+    cannot be known.
+    """
+    try:
+        r = session.head(url, allow_redirects=True)
+    except requests.exceptions.RequestException as e:
+        logging.debug('HEAD request on %s failed: %s', url, e)
+        return None
+
+    if r.status_code != 200:
+        return None
+
+    try:
+        return int(r.headers['content-length'])
+    except (KeyError, ValueError):
+        return None
+
+
+class DownloadPlan(object):
+    """
+    The resources selected for a class, built before anything is
+    downloaded, so that the amount of work is known in advance.
+
+    The plan also lists the files which are already present; only the
+    pending ones (those not present yet, and those to be revalidated with
+    conditional headers) are downloaded.  Once the downloads have started,
+    mark_done() keeps track of the progress to estimate the time left.
+
+    :param jobs: List of DownloadJob.
+    """
+
+    # ways of ordering the pending jobs
+    ORDERS = ('largest', 'smallest')
+
+    def __init__(self, jobs=None):
+        self.jobs = list(jobs or [])
+
+        # directories of the selected sections
+        self.directories = []
+
+        # time of the most recent change among the present files, or -1
+        self.last_update = -1
+
+        self._lock = threading.Lock()
+        self._started = None
+        self._count = 0
+        self._size = None
+        self._done = 0
+        self._done_size = 0
+
+    def add(self, job):
+        self.jobs.append(job)
+
+    def pending(self, order=None):
+        """
+        Return the jobs to be run, either in syllabus order or sorted by
+        size ('largest' or 'smallest' first).  Jobs of unknown size go
+        last.
+        """
+        jobs = [job for job in self.jobs
+                if not job.present or job.headers is not None]
+
+        if order == 'largest':
+            jobs.sort(key=lambda job: (job.size is None, -(job.size or 0)))
+        elif order == 'smallest':
+            jobs.sort(key=lambda job: (job.size is None, job.size))
+        elif order is not None:
+            raise ValueError('Unknown order: %s' % order)
+
+        return jobs
+
+    def estimate_sizes(self, session, jobs=1):
+        """
+        Fill in the size of the pending jobs with HEAD requests, running
+        up to `jobs` of them at once.
+        """
+        unknown = [job for job in self.pending() if job.size is None]
+        sizes = parallel_map(
+            lambda job: get_content_length(session, job.url), unknown, jobs)
+        for job, size in zip(unknown, sizes):
+            job.size = size
+
+    def total_size(self):
+        """
+        Return the total size of the pending jobs, or None if the size of
+        some of them is unknown.
+        """
+        sizes = [job.size for job in self.pending()]
+        if None in sizes:
+            return None
+        return sum(sizes)
+
+    def as_dict(self):
+        pending = self.pending()
+        return {'jobs': [job.as_dict() for job in self.jobs],
+                'pending': len(pending),
+                'total_size': self.total_size()}
+
+    def start(self):
+        """
+        Start keeping track of the progress of the pending jobs.
+        """
+        with self._lock:
+            self._started = time.time()
+            self._count = len(self.pending())
+            self._size = self.total_size()
+            self._done = 0
+            self._done_size = 0
+
+    def mark_done(self, job):
+        """
+        Record that job has been downloaded, and log the progress.
+        """
+        with self._lock:
+            self._done += 1
+            self._done_size += job.size or 0
+            done = self._done
+
+        logging.info('Done %d of %d, %s', done, self._count,
+                     self.format_eta())
+
+    def eta(self):
+        """
+        Return the estimated number of seconds before all the pending jobs
+        are done, or None.  The estimate is based on the sizes if they are
+        all known, and on the number of jobs otherwise.
+        """
+        with self._lock:
+            if self._started is None:
+                return None
+
+            if self._size:
+                done, total = self._done_size, self._size
+            else:
+                done, total = self._done, self._count
+            if not done:
+                return None
+
+            elapsed = time.time() - self._started
+            return max(0, elapsed * (total - done) / float(done))
+
+    def format_eta(self):
+        eta = self.eta()
+        if eta is None:
+            return 'ETA unknown'
+
+        eta = 'ETA %s' % datetime.timedelta(seconds=int(eta))
+        if self._size:
+            return '%s of %s, %s' % (format_bytes(self._done_size),
+                                     format_bytes(self._size), eta)
+        return eta
+
+
+def parse_retry_after(value):
+    """
+    Return the number of seconds to wait given the value of a Retry-After
+    header (either a number of seconds or an HTTP date), or None.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0, mktime_tz(date) - time.time())
+
+
+class DownloadScheduler(object):
+    """
+    Keeps up to `jobs` downloads running at once, with at most
+    `jobs_per_host` of them going to the same host.
+
+    Downloads failing with a DownloadError are put in a deferred queue and
+    tried again after a jittered exponential backoff (or after the delay
+    asked by the server with Retry-After), while the other downloads go on.
+
+    Usage::
+
+      >>> s = DownloadScheduler(downloader, jobs=4, jobs_per_host=2)
+      >>> s.run([DownloadJob('http://example.com/a.pdf', 'a.pdf')])
+
+    :param downloader: Downloader instance used for every job.
+    :param jobs: Number of simultaneous downloads.
+    :param jobs_per_host: Maximum number of simultaneous downloads from the
+        same host. None means no limit other than `jobs`.
+    :param max_attempts: Number of times a download is tried before giving
+        up on it.
+    :param backoff: Base delay in seconds before the first retry.
+    :param max_backoff: Maximum delay in seconds between two attempts.
+    :param on_complete: Function called with each job and the value
+        returned by the downloader once the job is successfully done.  It
+        is called from the worker threads.
+    """
+
+    def __init__(self, downloader, jobs=1, jobs_per_host=None,
+                 max_attempts=5, backoff=2, max_backoff=300,
+                 on_complete=None):
+        self.downloader = downloader
+        self.on_complete = on_complete
+        self.jobs = max(1, jobs or 1)
+        self.jobs_per_host = jobs_per_host
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        # jobs which needed more than one attempt, and jobs which failed
+        # permanently, along with their last error
+        self.retried = []
+        self.failed = []
+
+        self._lock = threading.Condition()
+        self._pending = deque()
+        self._deferred = []  # heap of (time, counter, job)
+        self._counter = 0
+        self._active_hosts = {}
+        self._running = 0
+        self._error = None
+
+    def _host_available(self, host):
+        if not self.jobs_per_host:
+            return True
+        return self._active_hosts.get(host, 0) < self.jobs_per_host
+
+    def _retry_delay(self, job, error):
+        retry_after = parse_retry_after(error.retry_after)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+
+        delay = self.backoff * 2 ** (job.attempts - 1)
+        return min(delay, self.max_backoff) * random.uniform(0.5, 1.5)
+
+    def _next_job(self):
+        """
+        Return the first pending job whose host is below its concurrency
+        cap, waiting for a slot or for a deferred job to be due if needed.
+        Returns None when there is nothing left to do.
+        """
+        with self._lock:
+            while True:
+                if self._error is not None:
+                    return None
+
+                now = time.time()
+                while self._deferred and self._deferred[0][0] <= now:
+                    self._pending.append(heapq.heappop(self._deferred)[2])
+
+                for job in self._pending:
+                    if self._host_available(job.host):
+                        self._pending.remove(job)
+                        self._active_hosts[job.host] = \
+                            self._active_hosts.get(job.host, 0) + 1
+                        self._running += 1
+                        return job
+
+                if not (self._pending or self._deferred or self._running):
+                    return None
+
+                timeout = None
+                if self._deferred:
+                    timeout = self._deferred[0][0] - now
+                self._lock.wait(timeout)
+
+    def _job_done(self, job, error=None):
+        with self._lock:
+            self._active_hosts[job.host] -= 1
+            self._running -= 1
+
+            if isinstance(error, DownloadError):
+                if job.attempts < self.max_attempts:
+                    delay = self._retry_delay(job, error)
+                    logging.warn('Error downloading %s (%s), will retry in'
+                                 ' %d seconds ...', job.filename, error,
+                                 delay)
+                    self._counter += 1
+                    heapq.heappush(self._deferred,
+                                   (time.time() + delay, self._counter, job))
+                else:
+                    logging.error('Skipping, can\'t download %s: %s',
+                                  job.filename, error)
+                    self.failed.append((job, error))
+            elif error is not None:
+                if self._error is None:
+                    self._error = error
+            elif job.attempts > 1:
+                self.retried.append(job)
+
+            self._lock.notify_all()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+
+            job.attempts += 1
+            try:
+                logging.info('Downloading: %s', job.filename)
+                result = self.downloader.download(job.url, job.filename,
+                                                  job.headers)
+                if self.on_complete is not None:
+                    self.on_complete(job, result)
+            except Exception as e:
+                self._job_done(job, e)
+            else:
+                self._job_done(job)
+
+    def run(self, jobs):
+        """
+        Download all the given jobs and return once they are done, either
+        successfully or after exhausting their attempts.
+
+        If a download raises any other exception, no new downloads are
+        started and the exception is raised again once the running ones
+        have finished.
+        """
+
+        self._pending.extend(jobs)
+
+        if self.jobs == 1:
+            # Run in the calling thread, so that the downloaders can handle
+            # Ctrl-C themselves.
+            self._worker()
+        else:
+            threads = []
+            for _ in range(min(self.jobs, len(self._pending))):
+                t = threading.Thread(target=self._worker)
+                t.daemon = True
+                t.start()
+                threads.append(t)
+
+            try:
+                for t in threads:
+                    # join() without a timeout cannot be interrupted
+                    while t.is_alive():
+                        t.join(0.5)
+            except KeyboardInterrupt:
+                with self._lock:
+                    self._pending.clear()
+                    del self._deferred[:]
+                    self._lock.notify_all()
+                raise
+
+        if self._error is not None:
+            raise self._error
+
+    def report(self):
+        """
+        Log a summary of the retried and permanently failed downloads.
+        """
+        if self.retried:
+            logging.info('Downloaded after retrying (%d):', len(self.retried))
+            for job in self.retried:
+                logging.info('  %s (%d attempts)', job.filename, job.attempts)
+
+        if self.failed:
+            logging.error('Failed permanently (%d):', len(self.failed))
+            for job, error in self.failed:
+                logging.error('  %s: %s (%s)', job.filename, error, job.url)
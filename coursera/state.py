@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module for the database recording what has been downloaded for a class.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from collections import namedtuple
+
+from .utils import mkdir_p
+
+# Name of the database file, kept in the directory of each class.
+STATE_FILENAME = '.coursera-dl.sqlite'
+
+# Number of records buffered before they are committed.
+COMMIT_EVERY = 50
+
+StateRecord = namedtuple(
+    'StateRecord', 'url size etag last_modified completed')
+
+
+class DownloadState(object):
+    """
+    Records, for every downloaded resource of a class, its URL, local path,
+    size, ETag, Last-Modified and completion time.
+
+    All the records are read in bulk when the database is opened, so that
+    deciding whether a resource must be downloaded does not need to stat
+    the file, which is slow on network filesystems.
+
+    :param directory: Directory of the class.  Paths are recorded relative
+        to it, so that the archive can be moved around.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        mkdir_p(directory)
+
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._conn = sqlite3.connect(
+            os.path.join(directory, STATE_FILENAME),
+            check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS resources ('
+            ' path TEXT PRIMARY KEY,'
+            ' url TEXT,'
+            ' size INTEGER,'
+            ' etag TEXT,'
+            ' last_modified TEXT,'
+            ' completed REAL)')
+        self._conn.commit()
+
+        self._records = dict(
+            (row[0], StateRecord(*row[1:])) for row in self._conn.execute(
+                'SELECT path, url, size, etag, last_modified, completed'
+                ' FROM resources'))
+        logging.debug('Loaded %d records from the download state',
+                      len(self._records))
+
+    def _key(self, filename):
+        return os.path.relpath(filename, self.directory)
+
+    def get(self, filename):
+        """
+        Return the StateRecord of filename, or None if it is unknown.
+        """
+        return self._records.get(self._key(filename))
+
+    def record(self, url, filename, size, etag=None, last_modified=None,
+               completed=None):
+        """
+        Record that url has been downloaded to filename.
+        """
+        if completed is None:
+            completed = time.time()
+
+        key = self._key(filename)
+        record = StateRecord(url, size, etag, last_modified, completed)
+
+        with self._lock:
+            self._records[key] = record
+            self._conn.execute(
+                'INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?)',
+                (key,) + tuple(record))
+            self._uncommitted += 1
+            if self._uncommitted >= COMMIT_EVERY:
+                self._commit()
+
+    def record_file(self, url, filename, headers=None, stat=None):
+        """
+        Record filename as downloaded from url, reading its size and
+        completion time from the filesystem, unless its stat result is
+        given.
+        """
+        headers = headers or {}
+        if stat is None:
+            stat = os.stat(filename)
+        self.record(url, filename, stat.st_size,
+                    headers.get('etag'), headers.get('last-modified'),
+                    stat.st_mtime)
+
+    def forget(self, filename):
+        key = self._key(filename)
+        with self._lock:
+            self._records.pop(key, None)
+            self._conn.execute('DELETE FROM resources WHERE path = ?', (key,))
+            self._uncommitted += 1
+
+    def verify(self):
+        """
+        Reconcile the records with the files on disk: forget the files
+        which are gone or whose size changed.  Returns the number of
+        forgotten records.
+        """
+        forgotten = 0
+        for key, record in list(self._records.items()):
+            filename = os.path.join(self.directory, key)
+            try:
+                size = os.path.getsize(filename)
+            except OSError:
+                size = None
+
+            if size != record.size:
+                logging.info('%s changed on disk, forgetting it', filename)
+                self.forget(filename)
+                forgotten += 1
+
+        return forgotten
+
+    def _commit(self):
+        self._conn.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
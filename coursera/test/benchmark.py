@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the syllabus parsers.
+
+Times parse_syllabus, and measures the memory it allocates, on every page of
+the HTML fixtures and on generated syllabi of increasing size, with each
+available parser: the fast extractor, and BeautifulSoup with each installed
+tree builder.  The results are written as a JSON report, e.g.::
+
+  python -m coursera.test.benchmark -o benchmark.json
+
+This module is not collected with the tests, as it takes a while.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from coursera import coursera_dl, parsers, utils
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'html')
+
+# number of sections of the generated syllabi
+SYNTHETIC_SIZES = (10, 100, 1000)
+
+# number of lectures in each section of the generated syllabi
+LECTURES_PER_SECTION = 5
+
+
+def generate_syllabus(num_sections,
+                      lectures_per_section=LECTURES_PER_SECTION):
+    """
+    Return a syllabus page with the given number of sections, laid out like
+    the regular syllabus pages.
+    """
+    html = ['<html><body><div class="course-item-list">']
+    lecture_id = 0
+
+    for section in range(num_sections):
+        html.append(
+            '<div class="course-item-list-header expanded"><h3>'
+            '<span class="icon-chevron-down"></span> &nbsp;Week {0}'
+            ' - Section {0}</h3></div>'
+            '<ul class="course-item-list-section-list">'.format(section))
+
+        for _ in range(lectures_per_section):
+            lecture_id += 1
+            url = 'https://class.coursera.org/bench-001/lecture'
+            html.append(
+                '<li class="unviewed"><a data-lecture-id="{0}"'
+                ' data-modal-iframe="{1}/view?lecture_id={0}"'
+                ' href="{1}/{0}" class="lecture-link">'
+                'Lecture {0} (12:34)</a>'
+                '<div class="course-lecture-item-resource">'
+                '<a href="{1}/slides/{0}.pdf" title="PDF"></a>'
+                '<a href="{1}/slides/{0}.pptx" title="PPT"></a>'
+                '<a href="{1}/subtitles?q={0}_en&amp;format=srt"'
+                ' title="Subtitles (srt)"></a>'
+                '<a href="{1}/download.mp4?lecture_id={0}"'
+                ' title="Video (MP4)"></a>'
+                '</div></li>'.format(lecture_id, url))
+
+        html.append('</ul>')
+
+    html.append('</div></body></html>')
+    return ''.join(html)
+
+
+def get_inputs():
+    """
+    Return the list of (name, page) to be parsed.
+    """
+    inputs = []
+    for filename in sorted(os.listdir(FIXTURES)):
+        with open(os.path.join(FIXTURES, filename)) as f:
+            inputs.append((filename, f.read()))
+
+    for size in SYNTHETIC_SIZES:
+        inputs.append(('synthetic-{0}'.format(size),
+                       generate_syllabus(size)))
+
+    return inputs
+
+
+def get_backends():
+    """
+    Return the list of (name, parser, tree builder) to be benchmarked.
+    """
+    backends = [('fast', 'fast', None)]
+    for soup_parser in sorted(parsers.SOUP_PARSERS):
+        if parsers.is_available(soup_parser):
+            backends.append(('soup/' + soup_parser, 'soup', soup_parser))
+    return backends
+
+
+def _parse(page, parser):
+    # the filenames are cleaned again on every run
+    cache_clear = getattr(utils._clean_filename, 'cache_clear', None)
+    if cache_clear is not None:
+        cache_clear()
+
+    return coursera_dl.parse_syllabus(None, page, lazy=True, parser=parser)
+
+
+def measure(page, parser, soup_parser, repeat=3):
+    """
+    Return the measures of parsing page with the given parser.
+    """
+    parsers.set_soup_parser(soup_parser)
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.time()
+        sections = _parse(page, parser)
+        times.append(time.time() - start)
+
+    peak = None
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        _parse(page, parser)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    num_sections = len(sections)
+    return {
+        'sections': num_sections,
+        'lectures': sum(len(lectures) for (_, lectures) in sections),
+        'page_size': len(page),
+        'best_time': min(times),
+        'times': times,
+        'time_per_section': (min(times) / num_sections
+                             if num_sections else None),
+        'peak_memory': peak,
+    }
+
+
+def run(repeat=3):
+    """
+    Run the benchmark and return the report.
+    """
+    results = []
+    for name, page in get_inputs():
+        for backend, parser, soup_parser in get_backends():
+            result = measure(page, parser, soup_parser, repeat)
+            result['input'] = name
+            result['backend'] = backend
+            results.append(result)
+            print('{0:45} {1:18} {2:8.3f}s {3:>12}'.format(
+                name, backend, result['best_time'],
+                result['peak_memory'] or 'N/A'), file=sys.stderr)
+
+    parsers.set_soup_parser(None)
+
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the syllabus parsers.')
+    parser.add_argument('-o', '--output',
+                        dest='output',
+                        default='-',
+                        help='file where the JSON report is written'
+                             ' (default: standard output)')
+    parser.add_argument('-r', '--repeat',
+                        dest='repeat',
+                        type=int,
+                        default=3,
+                        help='number of timed runs of each parse'
+                             ' (default: 3)')
+    args = parser.parse_args()
+
+    # the parser logs every section and lecture, and complains about the
+    # pages without any
+    logging.disable(logging.ERROR)
+
+    report = json.dumps(run(args.repeat), indent=2, sort_keys=True)
+    if args.output == '-':
+        print(report)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the persistent caches.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import six
+
+from coursera import cache
+
+
+class JsonCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'sub', 'cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_and_set(self):
+        c = cache.JsonCache(self.filename)
+        self.assertEqual(c.get('key'), None)
+
+        c.set('key', 'value', 60)
+        self.assertEqual(c.get('key'), 'value')
+
+        c.delete('key')
+        self.assertEqual(c.get('key'), None)
+
+    def test_expired_entries(self):
+        c = cache.JsonCache(self.filename)
+        c.set('key', 'value', -1)
+        self.assertEqual(c.get('key'), None)
+
+    def test_save_and_load(self):
+        c = cache.JsonCache(self.filename)
+        c.set('key', [1, 2], 60)
+        c.set('old', 'value', -1)
+        c.save()
+
+        c = cache.JsonCache(self.filename)
+        self.assertEqual(c.get('key'), [1, 2])
+        self.assertEqual(c._entries.get('old'), None)
+
+    def test_save_keeps_entries_from_others(self):
+        c1 = cache.JsonCache(self.filename)
+        c2 = cache.JsonCache(self.filename)
+
+        c1.set('first', 1, 60)
+        c1.save()
+        c2.set('second', 2, 60)
+        c2.save()
+
+        c = cache.JsonCache(self.filename)
+        self.assertEqual(c.get('first'), 1)
+        self.assertEqual(c.get('second'), 2)
+
+    def test_corrupted_file(self):
+        os.makedirs(os.path.dirname(self.filename))
+        with open(self.filename, 'w') as f:
+            f.write('{not json')
+
+        c = cache.JsonCache(self.filename)
+        self.assertEqual(c.get('key'), None)
+
+
+class MissingCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'missing.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_record_failure(self):
+        c = cache.MissingCache(self.filename, 60)
+        c.record_failure('http://example.com/a.pdf', 404)
+        c.record_failure('http://example.com/b.pdf', 500)
+
+        self.assertTrue(c.is_missing('http://example.com/a.pdf'))
+        self.assertFalse(c.is_missing('http://example.com/b.pdf'))
+
+    def test_recheck(self):
+        c = cache.MissingCache(self.filename, 60)
+        c.record_failure('http://example.com/a.pdf', 410)
+        c.save()
+
+        c = cache.MissingCache(self.filename, 60, recheck=True)
+        self.assertFalse(c.is_missing('http://example.com/a.pdf'))
+
+    def test_ttl(self):
+        c = cache.MissingCache(self.filename, 60)
+        c.record_failure('http://example.com/a.pdf', 404)
+        c._entries['http://example.com/a.pdf']['expires'] = time.time() - 1
+        self.assertFalse(c.is_missing('http://example.com/a.pdf'))
+
+
+class PageCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmpdir, 'pages')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_store_and_load(self):
+        c = cache.PageCache(self.directory, 60)
+        url = 'https://class.coursera.org/ml-001/lecture/index'
+        self.assertEqual(c.load(url), None)
+
+        c.store(url, six.u('<html>caf\u00e9</html>'), '"abc"', None)
+        entry = c.load(url)
+        self.assertEqual(entry['text'], six.u('<html>caf\u00e9</html>'))
+        self.assertEqual(entry['etag'], '"abc"')
+        self.assertTrue(c.is_fresh(entry))
+        self.assertEqual(c.conditional_headers(entry),
+                         {'If-None-Match': '"abc"'})
+
+    def test_stale_entry(self):
+        c = cache.PageCache(self.directory, 0)
+        url = 'https://class.coursera.org/ml-001/lecture/index'
+        c.store(url, 'page', None, 'Mon, 06 Jan 2014 10:00:00 GMT')
+
+        entry = c.load(url)
+        self.assertFalse(c.is_fresh(entry))
+        self.assertEqual(
+            c.conditional_headers(entry),
+            {'If-Modified-Since': 'Mon, 06 Jan 2014 10:00:00 GMT'})
+
+
+class ParseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmpdir, 'syllabi')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_make_key(self):
+        page = six.u('<html>caf\u00e9</html>')
+        key = cache.ParseCache.make_key(page, False, 'soup')
+        self.assertEqual(key, cache.ParseCache.make_key(page, False, 'soup'))
+        self.assertNotEqual(key,
+                            cache.ParseCache.make_key(page, True, 'soup'))
+        self.assertNotEqual(
+            key, cache.ParseCache.make_key(six.u('<html>cafe</html>'), False,
+                                           'soup'))
+
+    def test_store_and_load(self):
+        c = cache.ParseCache(self.directory)
+        self.assertEqual(c.load('abc'), None)
+
+        c.store('abc', [['Week_1', []]])
+        self.assertEqual(c.load('abc'), [['Week_1', []]])
+
+    def test_oldest_entries_are_removed(self):
+        c = cache.ParseCache(self.directory, max_entries=2)
+        for i, key in enumerate(['a', 'b', 'c']):
+            c.store(key, i)
+            os.utime(c._filename(key), (1000 + i, 1000 + i))
+        c.store('d', 3)
+
+        self.assertEqual(c.load('a'), None)
+        self.assertEqual(c.load('b'), None)
+        self.assertEqual(c.load('c'), 2)
+        self.assertEqual(c.load('d'), 3)
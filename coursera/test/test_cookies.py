@@ -9,6 +9,7 @@ import os.path
 import unittest
 
 import six
+from six import iteritems
 
 from coursera import cookies
 
@@ -107,3 +108,90 @@ class CookiesFileTestCase(unittest.TestCase):
         values = 'csrf_token=csrfclass001; session=sessionclass1'
         cookie_values = cookies.make_cookie_values(cj, 'class-001')
         self.assertEquals(cookie_values, values)
+
+
+class MockCookieSession(object):
+    def __init__(self):
+        import requests
+        self.cookies = requests.cookies.RequestsCookieJar()
+
+
+class AccountTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import requests
+        self.cached = requests.cookies.RequestsCookieJar()
+        self.logins = []
+        self.redirects = []
+        self.written = []
+        self.stale = False
+        self.originals = {}
+
+        def login(session, class_name, username, password):
+            self.logins.append(class_name)
+            self.stale = False
+            session.cookies.set('CAUTH', 'new', domain='.coursera.org')
+
+        def down_the_wabbit_hole(session, class_name):
+            self.redirects.append(class_name)
+            if not self.stale:
+                session.cookies.set('csrf_token', 'token',
+                                    domain='class.coursera.org',
+                                    path='/' + class_name)
+
+        self.patch('get_cookies_from_cache', lambda username: self.cached)
+        self.patch('write_cookies_to_cache',
+                   lambda cj, username: self.written.append(username))
+        self.patch('login', login)
+        self.patch('down_the_wabbit_hole', down_the_wabbit_hole)
+
+    def tearDown(self):
+        for name, value in iteritems(self.originals):
+            setattr(cookies, name, value)
+
+    def patch(self, name, value):
+        self.originals[name] = getattr(cookies, name)
+        setattr(cookies, name, value)
+
+    def authenticate(self, account, class_name):
+        session = MockCookieSession()
+        account.authenticate(session, class_name)
+        return session
+
+    def test_login_once(self):
+        account = cookies.Account('user', 'pass')
+        for class_name in ('class-001', 'class-002'):
+            session = self.authenticate(account, class_name)
+            self.assertTrue(cookies.do_we_have_enough_cookies(
+                session.cookies, class_name))
+
+        self.assertEquals(self.logins, ['class-001'])
+        self.assertEquals(self.redirects, ['class-001', 'class-002'])
+
+        self.assertEquals(self.written, [])
+        account.save()
+        account.save()
+        self.assertEquals(self.written, ['user'])
+
+    def test_cached_login(self):
+        self.cached.set('CAUTH', 'cached', domain='.coursera.org')
+        account = cookies.Account('user', 'pass')
+        self.authenticate(account, 'class-001')
+        self.assertEquals(self.logins, [])
+
+    def test_stale_login(self):
+        self.cached.set('CAUTH', 'stale', domain='.coursera.org')
+        self.stale = True
+        account = cookies.Account('user', 'pass')
+        session = self.authenticate(account, 'class-001')
+        self.assertEquals(self.logins, ['class-001'])
+        self.assertEquals(session.cookies.get('CAUTH'), 'new')
+
+    def test_authentication_failure_after_login(self):
+        account = cookies.Account('user', 'pass')
+        self.authenticate(account, 'class-001')
+
+        self.stale = True
+        self.assertRaises(cookies.AuthenticationFailed,
+                          self.authenticate, account, 'class-002')
+        self.assertEquals(self.logins, ['class-001'])
@@ -131,31 +131,377 @@ class ExternalDownloaderTestCase(unittest.TestCase):
         self.assertTrue(any("csrf_token=csrfclass001" in e for e in command))
         self.assertTrue(any("session=sessionclass1" in e for e in command))
 
+    def _get_jobs(self):
+        from coursera.scheduler import DownloadJob
+
+        return [DownloadJob('http://www.coursera.org/1.pdf', 'sec/01.pdf'),
+                DownloadJob('http://www.example.org/2.mp4', '02 "a".mp4')]
+
+    def test_aria2_batch(self):
+        s = self._get_session()
+
+        d = downloaders.Aria2Downloader(s)
+        self.assertTrue(d.supports_batch)
+
+        lines = d._create_batch_input(self._get_jobs()).splitlines()
+        self.assertEquals(lines[0], 'http://www.coursera.org/1.pdf')
+        self.assertTrue('  dir=sec' in lines)
+        self.assertTrue('  out=01.pdf' in lines)
+        self.assertTrue('  out=02 "a".mp4' in lines)
+        self.assertTrue('  dir=.' in lines)
+        cookies = [l for l in lines if l.startswith('  header=Cookie: ')]
+        self.assertEquals(len(cookies), 2)
+        self.assertTrue('csrf_token=csrfclass001' in cookies[0])
+        self.assertTrue('k=v' in cookies[1])
+
+        command = d._create_batch_command('input.txt', 4)
+        self.assertEquals(command[:5],
+                          ['aria2c', '-i', 'input.txt', '-j', '4'])
+
+    def test_curl_batch(self):
+        s = self._get_session()
+
+        d = downloaders.CurlDownloader(s)
+        self.assertTrue(d.supports_batch)
+
+        groups = d._create_batch_input(self._get_jobs()).split('next\n')
+        self.assertEquals(len(groups), 2)
+        self.assertTrue('url = "http://www.coursera.org/1.pdf"' in groups[0])
+        self.assertTrue('output = "sec/01.pdf"' in groups[0])
+        self.assertTrue('csrf_token=csrfclass001' in groups[0])
+        self.assertTrue('output = "02 \\"a\\".mp4"' in groups[1])
+        self.assertTrue('cookie = "k=v"' in groups[1])
+
+        self.assertEquals(d._create_batch_command('input.txt', 1),
+                          ['curl', '-#', '-K', 'input.txt'])
+        self.assertTrue('--parallel' in d._create_batch_command('in.txt', 2))
+
+    def test_wget_and_axel_do_not_support_batch(self):
+        self.assertFalse(downloaders.WgetDownloader(None).supports_batch)
+        self.assertFalse(downloaders.AxelDownloader(None).supports_batch)
+
 
 class NativeDownloaderTestCase(unittest.TestCase):
 
-    def test_all_attempts_have_failed(self):
-        import time
+    def setUp(self):
+        self._tempdirs = []
+
+    def tearDown(self):
+        import shutil
+
+        for tmpdir in self._tempdirs:
+            shutil.rmtree(tmpdir)
+
+    def test_failed_download_raises_error(self):
 
         class IObject(object):
-            pass
+            def close(self):
+                pass
 
         class MockSession:
 
-            def get(self, url, stream=True):
+            def get(self, url, stream=True, headers=None):
                 object_ = IObject()
                 object_.status_code = 400
                 object_.reason = None
+                object_.headers = {'retry-after': '10'}
                 return object_
 
-        _sleep = time.sleep
-        time.sleep = lambda interval: 0
+        session = MockSession()
+        d = downloaders.NativeDownloader(session)
+        try:
+            d._start_download('download_url', 'save_to')
+        except downloaders.DownloadError as e:
+            self.assertEqual(e.status_code, 400)
+            self.assertEqual(e.retry_after, '10')
+            self.assertEqual(str(e), 'HTTP Error 400')
+        else:
+            self.fail('DownloadError not raised')
+
+    def test_connection_error_raises_download_error(self):
+        import requests
+
+        class MockSession:
+
+            def get(self, url, stream=True, headers=None):
+                raise requests.exceptions.ConnectionError('reset')
+
+        d = downloaders.NativeDownloader(MockSession())
+        self.assertRaises(downloaders.DownloadError,
+                          d._start_download, 'download_url', 'save_to')
+
+    def test_write_error_is_not_a_download_error(self):
+        import os
+
+        session = self._get_resuming_session(b'0123456789')
+        d = downloaders.NativeDownloader(session)
+        filename = os.path.join(self._get_tempdir(), 'missing', 'video.mp4')
+        try:
+            d._start_download('download_url', filename)
+        except downloaders.DownloadError:
+            self.fail('DownloadError raised')
+        except IOError:
+            pass
+        else:
+            self.fail('IOError not raised')
+
+    def test_read_error_raises_download_error(self):
+        import os
+        import socket
+
+        class MockRaw(object):
+            def read(self, size):
+                raise socket.error('reset')
+
+        class MockResponse(object):
+            status_code = 200
+            headers = {}
+            raw = MockRaw()
+
+            def close(self):
+                pass
+
+        class MockSession(object):
+            def get(self, url, stream=True, headers=None):
+                return MockResponse()
+
+        filename = os.path.join(self._get_tempdir(), 'video.mp4')
+        d = downloaders.NativeDownloader(MockSession())
+        self.assertRaises(downloaders.DownloadError,
+                          d._start_download, 'download_url', filename)
+
+    def _get_resuming_session(self, content, support_range=True, etag=None,
+                              range_offset=0):
+
+        class MockRaw(object):
+            def __init__(self, data):
+                self.data = data
+
+            def read(self, size):
+                data, self.data = self.data[:size], self.data[size:]
+                return data
+
+        class MockResponse(object):
+            reason = None
+
+            def close(self):
+                pass
+
+        class MockSession(object):
+            def __init__(self):
+                self.requested_headers = []
+
+            def head(self, url, allow_redirects=False):
+                r = MockResponse()
+                r.url = url
+                r.status_code = 200
+                r.headers = {'content-length': str(len(content))}
+                if support_range:
+                    r.headers['accept-ranges'] = 'bytes'
+                return r
+
+            def get(self, url, stream=True, headers=None):
+                self.requested_headers.append(headers)
+                r = MockResponse()
+                start, end = 0, len(content) - 1
+                r.headers = {}
+                if support_range and headers and 'Range' in headers and \
+                        headers.get('If-Range', etag) == etag:
+                    start, end = headers['Range'][6:].split('-')
+                    start = int(start) + range_offset
+                    end = int(end) if end else len(content) - 1
+                    r.status_code = 206
+                    r.headers['content-range'] = 'bytes {0}-{1}/{2}'.format(
+                        start, end, len(content))
+                else:
+                    r.status_code = 200
+                r.headers['content-length'] = str(end + 1 - start)
+                if etag:
+                    r.headers['etag'] = etag
+                r.raw = MockRaw(content[start:end + 1])
+                return r
+
+        return MockSession()
+
+    def _get_tempdir(self):
+        import tempfile
+
+        tmpdir = tempfile.mkdtemp()
+        self._tempdirs.append(tmpdir)
+        return tmpdir
+
+    def test_download_is_renamed_when_complete(self):
+        import os
+
+        filename = os.path.join(self._get_tempdir(), 'video.mp4')
+        session = self._get_resuming_session(b'0123456789')
+        d = downloaders.NativeDownloader(session)
+        self.assertTrue(d._start_download('download_url', filename))
+        self.assertFalse(os.path.exists(filename + '.part'))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(session.requested_headers, [{}])
+
+    def test_download_is_resumed(self):
+        import os
+
+        filename = os.path.join(self._get_tempdir(), 'video.mp4')
+        with open(filename + '.part', 'wb') as f:
+            f.write(b'0123')
+
+        session = self._get_resuming_session(b'0123456789')
+        d = downloaders.NativeDownloader(session)
+
+        self.assertTrue(d._start_download('download_url', filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(session.requested_headers, [{'Range': 'bytes=4-'}])
+
+    def test_resume_is_conditional(self):
+        import os
+
+        filename = os.path.join(self._get_tempdir(), 'video.mp4')
+        with open(filename + '.part', 'wb') as f:
+            f.write(b'0123')
+        with open(filename + '.part.validator', 'w') as f:
+            f.write('"a"')
+
+        session = self._get_resuming_session(b'0123456789', etag='"a"')
+        d = downloaders.NativeDownloader(session)
+        self.assertTrue(d._start_download('download_url', filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(session.requested_headers,
+                         [{'Range': 'bytes=4-', 'If-Range': '"a"'}])
+        self.assertFalse(os.path.exists(filename + '.part.validator'))
+
+    def test_store_validator(self):
+        import os
+
+        part = os.path.join(self._get_tempdir(), 'video.mp4.part')
+        downloaders._store_validator(part, {'etag': '"a"',
+                                            'last-modified': 'date'})
+        self.assertEqual(downloaders._load_validator(part), '"a"')
+        downloaders._store_validator(part, {'etag': 'W/"a"',
+                                            'last-modified': 'date'})
+        self.assertEqual(downloaders._load_validator(part), 'date')
+        downloaders._store_validator(part, {})
+        self.assertEqual(downloaders._load_validator(part), None)
+
+    def test_changed_file_is_not_resumed(self):
+        import os
+
+        filename = os.path.join(self._get_tempdir(), 'video.mp4')
+        with open(filename + '.part', 'wb') as f:
+            f.write(b'old!')
+        with open(filename + '.part.validator', 'w') as f:
+            f.write('"old"')
+
+        session = self._get_resuming_session(b'0123456789', etag='"new"')
+        d = downloaders.NativeDownloader(session)
+        self.assertTrue(d._start_download('download_url', filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+
+    def test_unexpected_range_restarts(self):
+        import os
+
+        filename = os.path.join(self._get_tempdir(), 'video.mp4')
+        with open(filename + '.part', 'wb') as f:
+            f.write(b'0123')
+
+        session = self._get_resuming_session(b'0123456789', range_offset=2)
+        d = downloaders.NativeDownloader(session)
+        self.assertTrue(d._start_download('download_url', filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(session.requested_headers,
+                         [{'Range': 'bytes=4-'}, {}])
+
+    def test_download_restarts_without_range_support(self):
+        import os
+
+        filename = os.path.join(self._get_tempdir(), 'video.mp4')
+        with open(filename + '.part', 'wb') as f:
+            f.write(b'xxxx')
+
+        session = self._get_resuming_session(b'0123456789',
+                                             support_range=False)
+        d = downloaders.NativeDownloader(session)
+
+        self.assertTrue(d._start_download('download_url', filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+
+    def test_not_modified(self):
+        import os
+
+        filename = os.path.join(self._get_tempdir(), 'slides.pdf')
+        with open(filename, 'wb') as f:
+            f.write(b'old')
+
+        class MockResponse(object):
+            status_code = 304
+            headers = {}
+
+            def close(self):
+                pass
+
+        class MockSession(object):
+            def get(self, url, stream=True, headers=None):
+                self.headers = headers
+                return MockResponse()
 
         session = MockSession()
         d = downloaders.NativeDownloader(session)
-        self.assertFalse(d._start_download('download_url', 'save_to'))
+        r = d.download('download_url', filename, {'If-None-Match': '"a"'})
+
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(session.headers, {'If-None-Match': '"a"'})
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'old')
+
+    def test_segmented_download(self):
+        import os
+
+        filename = os.path.join(self._get_tempdir(), 'video.mp4')
+        session = self._get_resuming_session(b'0123456789')
+        d = downloaders.NativeDownloader(session, segments=3,
+                                         min_split_size=2)
 
-        time.sleep = _sleep
+        self.assertTrue(d._start_download('download_url', filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(
+            sorted(h['Range'] for h in session.requested_headers),
+            ['bytes=0-2', 'bytes=3-5', 'bytes=6-9'])
+
+    def test_small_file_is_not_segmented(self):
+        import os
+
+        filename = os.path.join(self._get_tempdir(), 'video.mp4')
+        session = self._get_resuming_session(b'0123456789')
+        d = downloaders.NativeDownloader(session, segments=4,
+                                         min_split_size=6)
+
+        self.assertTrue(d._start_download('download_url', filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(session.requested_headers, [{}])
+
+    def test_segmented_download_without_range_support(self):
+        import os
+
+        filename = os.path.join(self._get_tempdir(), 'video.mp4')
+        session = self._get_resuming_session(b'0123456789',
+                                             support_range=False)
+        d = downloaders.NativeDownloader(session, segments=3,
+                                         min_split_size=2)
+
+        self.assertTrue(d._start_download('download_url', filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(session.requested_headers, [{}])
 
 
 class DownloadProgressTestCase(unittest.TestCase):
@@ -166,6 +512,24 @@ class DownloadProgressTestCase(unittest.TestCase):
 
         return p
 
+    def test_quiet_progress(self):
+        import sys
+
+        import six
+
+        stdout = sys.stdout
+        sys.stdout = six.StringIO()
+        try:
+            p = downloaders.DownloadProgress(100, quiet=True)
+            p.start()
+            p.read(50)
+            p.stop()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(output, '')
+        self.assertEqual(p.calc_percent(), '[' + '#' * 50 + '] 100%')
+
     def test_calc_percent_if_total_is_zero(self):
         p = self._get_progress(0)
         self.assertEquals(p.calc_percent(), '--%')
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the data model of the syllabus.
+"""
+
+import unittest
+
+from coursera import models
+
+
+class ModelsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.lecture = models.make_lecture(
+            'Welcome', {'pdf': [('http://a.com/1.pdf', 'Slides'),
+                                ('http://a.com/2.pdf', '')]})
+        self.section = models.Section('Week_1', [self.lecture])
+
+    def test_tuple_shape(self):
+        name, lectures = self.section
+        self.assertEqual(name, 'Week_1')
+
+        lecname, resources = lectures[0]
+        self.assertEqual(lecname, 'Welcome')
+        self.assertEqual(resources['pdf'][0], ('http://a.com/1.pdf',
+                                               'Slides'))
+        self.assertEqual(resources['pdf'][1].title, '')
+
+    def test_no_instance_dictionary(self):
+        self.assertFalse(hasattr(self.section, '__dict__'))
+        self.assertFalse(hasattr(self.lecture, '__dict__'))
+        self.assertFalse(hasattr(models.Resource('http://a.com/'),
+                                 '__dict__'))
+
+    def test_formats_are_interned(self):
+        fmt = ''.join(['p', 'd', 'f'])
+        lecture = models.make_lecture('Welcome', {fmt: []})
+        self.assertTrue(list(lecture.resources)[0] is
+                        list(self.lecture.resources)[0])
+
+    def test_dirname(self):
+        self.assertEqual(self.section.dirname(3), '03_Week_1')
+        self.assertEqual(self.section.dirname(3, 'ml-001'),
+                         'ML-001_03_Week_1')
+
+    def test_filename(self):
+        self.assertEqual(self.lecture.filename(2, 'Slides', 'pdf'),
+                         '02_Welcome_Slides.pdf')
+        self.assertEqual(self.lecture.filename(2, '', 'pdf'),
+                         '02_Welcome.pdf')
+        self.assertEqual(self.lecture.filename(2, '', 'pdf', 1),
+                         '01_02_Welcome.pdf')
+
+    def test_as_tuples(self):
+        sections = models.as_tuples([self.section])
+        self.assertEqual(sections,
+                         [('Week_1', [('Welcome', {'pdf': [
+                             ('http://a.com/1.pdf', 'Slides'),
+                             ('http://a.com/2.pdf', '')]})])])
+        self.assertTrue(type(sections[0]) is tuple)
+        self.assertTrue(type(sections[0][1][0][1]['pdf'][0]) is tuple)
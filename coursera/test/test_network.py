@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the shared connection pool.
+"""
+
+import unittest
+
+from coursera import network
+
+
+class NetworkTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        network._adapter = None
+
+    def test_sessions_share_adapter(self):
+        s1 = network.create_session()
+        s2 = network.create_session()
+
+        self.assertTrue(s1.get_adapter('https://class.coursera.org') is
+                        s2.get_adapter('https://class.coursera.org'))
+        self.assertTrue(s1.get_adapter('http://example.com') is
+                        network.get_adapter())
+
+    def test_sessions_have_separate_cookies(self):
+        s1 = network.create_session()
+        s2 = network.create_session()
+
+        s1.cookies.set('csrf_token', 'abc', domain='class.coursera.org')
+        self.assertEqual(len(s1.cookies), 1)
+        self.assertEqual(len(s2.cookies), 0)
+
+    def test_configure_pool(self):
+        network.configure_pool(32)
+        self.assertEqual(network.get_adapter()._pool_maxsize, 32)
+
+        network.configure_pool(1)
+        self.assertEqual(network.get_adapter()._pool_maxsize,
+                         network.DEFAULT_POOL_SIZE)
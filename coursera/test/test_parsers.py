@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the choice of the HTML parser.
+"""
+
+import os
+import unittest
+
+from coursera import parsers
+
+
+class SoupParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.environ = os.environ.pop(parsers.HTML_PARSER_ENV, None)
+
+    def tearDown(self):
+        parsers.set_soup_parser(None)
+        os.environ.pop(parsers.HTML_PARSER_ENV, None)
+        if self.environ is not None:
+            os.environ[parsers.HTML_PARSER_ENV] = self.environ
+
+    def test_default(self):
+        if parsers.is_available('html5lib'):
+            self.assertEqual(parsers.get_soup_parser(), 'html5lib')
+        else:
+            self.assertEqual(parsers.get_soup_parser(), 'html.parser')
+
+    def test_environment(self):
+        os.environ[parsers.HTML_PARSER_ENV] = 'html.parser'
+        self.assertEqual(parsers.get_soup_parser(), 'html.parser')
+
+        os.environ[parsers.HTML_PARSER_ENV] = 'unknown'
+        self.assertRaises(ValueError, parsers.get_soup_parser)
+
+    def test_option_overrides_environment(self):
+        os.environ[parsers.HTML_PARSER_ENV] = 'unknown'
+        parsers.set_soup_parser('html.parser')
+        self.assertEqual(parsers.get_soup_parser(), 'html.parser')
+
+    def test_unknown_parser(self):
+        self.assertFalse(parsers.is_available('unknown'))
+        self.assertRaises(ValueError, parsers.set_soup_parser, 'unknown')
+
+    def test_strainer(self):
+        parsers.set_soup_parser('html.parser')
+        page = ('<p>Preamble</p><div class="course-item-list">'
+                '<div class="course-item-list-header"></div><ul></ul>'
+                '</div><p>Footer</p>')
+        soup = parsers.make_soup(page, parsers.SYLLABUS_STRAINER)
+        self.assertEqual(soup.find('p'), None)
+        self.assertEqual(soup.find('ul').previousSibling['class'],
+                         ['course-item-list-header'])
@@ -6,6 +6,9 @@ Test functionality of coursera module.
 """
 
 import os.path
+import shutil
+import sys
+import tempfile
 import unittest
 
 from six import iteritems
@@ -146,6 +149,497 @@ class TestSyllabusParsing(unittest.TestCase):
             num_resources=478,
             num_videos=97)
 
+    def test_fast_parser(self):
+        def simplify(sections):
+            return [(name, [(vname, sorted(
+                (fmt, [(getattr(r[0], 'page_url', r[0]), r[1])
+                       for r in resources])
+                for fmt, resources in iteritems(lecture)))
+                for (vname, lecture) in lectures])
+                for (name, lectures) in sections]
+
+        fixtures = os.path.join(os.path.dirname(__file__), "fixtures",
+                                "html")
+        for filename in sorted(os.listdir(fixtures)):
+            with open(os.path.join(fixtures, filename)) as syllabus:
+                page = syllabus.read()
+
+            # intact filenames, so that the names are compared as found
+            self.assertEqual(
+                simplify(coursera_dl.parse_syllabus_page(page, True,
+                                                         'fast')),
+                simplify(coursera_dl.parse_syllabus_page(page, True)))
+
+    def test_fast_parser_falls_back_to_soup(self):
+        def broken_extract_sections(page):
+            raise AssertionError("couldn't find section")
+
+        page = ('<div class="course-item-list-header"><h3><span></span>'
+                'Week 1</h3></div><ul><li><a href="http://a.com/1">'
+                'Intro</a><a href="http://a.com/1.pdf"></a></li></ul>')
+
+        extract_sections = coursera_dl.extract_sections
+        coursera_dl.extract_sections = broken_extract_sections
+        try:
+            sections = coursera_dl.parse_syllabus_page(page, parser='fast')
+        finally:
+            coursera_dl.extract_sections = extract_sections
+        self.assertEqual(sections,
+                         [('Week_1', [('Intro',
+                                       {'pdf': [('http://a.com/1.pdf',
+                                                 '')]})])])
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_is_cached(self):
+        from coursera.cache import ParseCache
+
+        tmpdir = self.tmpdir
+
+        class MockSession(object):
+            parse_cache = ParseCache(tmpdir)
+
+        filename = os.path.join(os.path.dirname(__file__), "fixtures",
+                                "html", "preview.html")
+        with open(filename) as syllabus:
+            page = syllabus.read()
+
+        session = MockSession()
+        sections = coursera_dl.parse_syllabus(session, page, lazy=True)
+
+        parse_syllabus_page = coursera_dl.parse_syllabus_page
+        coursera_dl.parse_syllabus_page = None
+        try:
+            cached = coursera_dl.parse_syllabus(session, page, lazy=True)
+        finally:
+            coursera_dl.parse_syllabus_page = parse_syllabus_page
+
+        self.assertEqual(
+            coursera_dl._encode_sections(cached),
+            coursera_dl._encode_sections(sections))
+        self.assertTrue(isinstance(cached[0][1][0][1]['mp4'][0][0],
+                                   coursera_dl.PendingVideo))
+
+        # other options are parsed again
+        intact_sections = coursera_dl.parse_syllabus(
+            session, page, lazy=True, intact_fnames=True)
+        self.assertNotEqual(
+            coursera_dl._encode_sections(intact_sections),
+            coursera_dl._encode_sections(sections))
+
+
+class TestParseSyllabi(unittest.TestCase):
+
+    def test_parse_in_processes(self):
+        fixtures = os.path.join(os.path.dirname(__file__), "fixtures",
+                                "html")
+        pages = []
+        for filename in ['preview.html', 'regular-syllabus.html']:
+            with open(os.path.join(fixtures, filename)) as syllabus:
+                pages.append(syllabus.read())
+
+        parsed = coursera_dl.parse_syllabi(pages, processes=2)
+        self.assertEqual(len(parsed), 2)
+        for page, sections in zip(pages, parsed):
+            self.assertEqual(
+                coursera_dl._encode_sections(sections),
+                coursera_dl._encode_sections(
+                    coursera_dl.parse_syllabus_page(page)))
+
+        # the pending videos come back from the worker processes
+        self.assertTrue(isinstance(parsed[0][0][1][0][1]['mp4'][0][0],
+                                   coursera_dl.PendingVideo))
+
+
+class TestResolveVideos(unittest.TestCase):
+
+    def setUp(self):
+        self.__get_video = coursera_dl.get_video
+        self.__grab_hidden_video_url = coursera_dl.grab_hidden_video_url
+
+        def new_get_video(session, url):
+            if url.endswith('missing'):
+                raise TypeError()
+            return url + '.mp4'
+        coursera_dl.get_video = new_get_video
+
+        def new_grab_hidden_video_url(session, href):
+            return href + '.mp4'
+        coursera_dl.grab_hidden_video_url = new_grab_hidden_video_url
+
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        coursera_dl.get_video = self.__get_video
+        coursera_dl.grab_hidden_video_url = self.__grab_hidden_video_url
+        shutil.rmtree(self.tmpdir)
+
+    def _pending(self, kind, url):
+        return (coursera_dl.PendingVideo(kind, url), '')
+
+    def test_resolve_videos(self):
+        preview = coursera_dl.PendingVideo.PREVIEW
+        iframe = coursera_dl.PendingVideo.IFRAME
+
+        lectures = [
+            {'mp4': [self._pending(preview, 'http://a/1'),
+                     self._pending(preview, 'http://a/2')]},
+            {'mp4': [self._pending(preview, 'http://a/missing'),
+                     self._pending(iframe, 'http://b/3')]},
+            {'mp4': [self._pending(iframe, 'http://b/4')],
+             'pdf': [('http://c/4.pdf', '')]},
+            {'mp4': [self._pending(preview, 'http://a/missing')]},
+            {'pdf': [('http://c/5.pdf', '')]},
+        ]
+        coursera_dl.resolve_videos(None, lectures, jobs=3)
+
+        self.assertEqual(lectures, [
+            {'mp4': [('http://a/1.mp4', '0_'), ('http://a/2.mp4', '')]},
+            {'mp4': [('http://b/3.mp4', '')]},
+            {'mp4': [('http://b/4.mp4', '')],
+             'pdf': [('http://c/4.pdf', '')]},
+            {},
+            {'pdf': [('http://c/5.pdf', '')]},
+        ])
+
+    def test_lazy_resolution(self):
+        from coursera.downloaders import Downloader
+
+        filename = os.path.join(os.path.dirname(__file__), "fixtures",
+                                "html", "preview.html")
+        with open(filename) as syllabus:
+            sections = coursera_dl.parse_syllabus(None, syllabus.read(),
+                                                  lazy=True)
+
+        resolved = []
+
+        def new_get_video(session, url):
+            resolved.append(url)
+            return url + '.mp4'
+        coursera_dl.get_video = new_get_video
+
+        tmpdir = self.tmpdir
+        downloader = Downloader()
+        coursera_dl.download_lectures(downloader, 'class', sections, ['pdf'],
+                                      skip_download=True, path=tmpdir)
+        self.assertEqual(resolved, [])
+
+        coursera_dl.download_lectures(downloader, 'class', sections, ['mp4'],
+                                      skip_download=True, path=tmpdir,
+                                      section_filter='^01_', jobs=2)
+        self.assertEqual(len(resolved), 0)
+
+        section = sections[0][0]
+        coursera_dl.download_lectures(downloader, 'class', sections, ['mp4'],
+                                      skip_download=True, path=tmpdir,
+                                      section_filter=section)
+        self.assertEqual(len(resolved), len(sections[0][1]))
+        self.assertEqual(sections[0][1][0][1]['mp4'],
+                         [(resolved[0] + '.mp4', '')])
+
+
+class TestGetPage(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from coursera.cache import PageCache
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = PageCache(self.tmpdir, 60)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _get_session(self, status_code=200, text='page', url=None):
+
+        class MockResponse(object):
+            def raise_for_status(self):
+                pass
+
+        class MockSession(object):
+            def __init__(self):
+                self.requests = []
+
+            def get(self, url_, headers=None):
+                self.requests.append(headers)
+                r = MockResponse()
+                r.status_code = status_code
+                r.text = text
+                r.url = url or url_
+                r.headers = {'etag': '"v1"'}
+                return r
+
+        return MockSession()
+
+    def test_get_page_without_cache(self):
+        session = self._get_session()
+        self.assertEqual(coursera_dl.get_page(session, 'http://a/'), 'page')
+
+    def test_fresh_page_is_not_requested(self):
+        session = self._get_session()
+        session.page_cache = self.cache
+
+        coursera_dl.get_page(session, 'http://a/')
+        self.assertEqual(coursera_dl.get_page(session, 'http://a/'), 'page')
+        self.assertEqual(session.requests, [{}])
+
+    def test_stale_page_is_revalidated(self):
+        self.cache.ttl = 0
+        self.cache.store('http://a/', 'cached page', '"v1"')
+
+        session = self._get_session(status_code=304, text='')
+        session.page_cache = self.cache
+
+        self.assertEqual(coursera_dl.get_page(session, 'http://a/'),
+                         'cached page')
+        self.assertEqual(session.requests, [{'If-None-Match': '"v1"'}])
+
+    def test_redirected_page_is_not_cached(self):
+        session = self._get_session(url='http://login/')
+        session.page_cache = self.cache
+
+        coursera_dl.get_page(session, 'http://a/')
+        self.assertEqual(self.cache.load('http://a/'), None)
+
+
+class TestVideoCache(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from coursera.cache import VideoCache
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = VideoCache(os.path.join(self.tmpdir, 'videos.json'), 60)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _get_session(self, page):
+
+        class MockResponse(object):
+            status_code = 200
+            headers = {}
+
+            def raise_for_status(self):
+                pass
+
+        class MockSession(object):
+            def __init__(self):
+                self.requested = []
+
+            def get(self, url, headers=None):
+                self.requested.append(url)
+                r = MockResponse()
+                r.text = page
+                r.url = url
+                return r
+
+        session = MockSession()
+        session.video_cache = self.cache
+        return session
+
+    def test_get_video_is_cached(self):
+        page = '<video><source type="video/mp4" src="http://v/1.mp4">'
+        session = self._get_session(page)
+        url = 'https://class.coursera.org/ml/lecture/preview_view?lecture_id=1'
+
+        self.assertEqual(coursera_dl.get_video(session, url),
+                         'http://v/1.mp4')
+        self.assertEqual(coursera_dl.get_video(session, url),
+                         'http://v/1.mp4')
+        self.assertEqual(session.requested, [url])
+
+    def test_hidden_video_is_cached(self):
+        page = '<video><source type="video/mp4" src="http://v/2.mp4">'
+        session = self._get_session(page)
+        url = 'https://example.com/iframe/2'
+
+        self.assertEqual(coursera_dl.grab_hidden_video_url(session, url),
+                         'http://v/2.mp4')
+        self.assertEqual(coursera_dl.grab_hidden_video_url(session, url),
+                         'http://v/2.mp4')
+        self.assertEqual(session.requested, [url])
+
+    def test_missing_hidden_video_is_not_cached(self):
+        session = self._get_session('<html></html>')
+        url = 'https://example.com/iframe/3'
+
+        self.assertEqual(coursera_dl.grab_hidden_video_url(session, url),
+                         None)
+        self.assertEqual(self.cache.lookup(url), None)
+
+
+class TestConditionalHeaders(unittest.TestCase):
+
+    def test_headers_from_record(self):
+        from coursera.state import StateRecord
+
+        record = StateRecord('http://example.com/a.pdf', 10, '"abc"',
+                             'Mon, 06 Jan 2014 10:00:00 GMT', 0)
+        headers = coursera_dl.get_conditional_headers(record, 0)
+        self.assertEqual(headers, {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Mon, 06 Jan 2014 10:00:00 GMT'})
+
+    def test_headers_from_mtime(self):
+        headers = coursera_dl.get_conditional_headers(None, 1389002400)
+        self.assertEqual(headers, {
+            'If-Modified-Since': 'Mon, 06 Jan 2014 10:00:00 GMT'})
+
+
+class TestFailedDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_missing_file_does_not_stop_the_class(self):
+        from coursera.downloaders import Downloader
+        from coursera.state import DownloadState
+
+        class QuietDownloader(Downloader):
+            # like wget and axel, which do not report their failures
+            def _start_download(self, url, filename):
+                if not url.endswith('missing.pdf'):
+                    with open(filename, 'w') as f:
+                        f.write(url)
+
+        sections = [('Week_1', [
+            ('A', {'pdf': [('http://a.com/missing.pdf', '')]}),
+            ('B', {'pdf': [('http://a.com/b.pdf', '')]})])]
+
+        state = DownloadState(os.path.join(self.tmpdir, 'class'))
+        try:
+            coursera_dl.download_lectures(QuietDownloader(), 'class',
+                                          sections, ['pdf'],
+                                          path=self.tmpdir, state=state)
+        finally:
+            state.close()
+
+        sec = os.path.join(self.tmpdir, 'class', '01_Week_1')
+        self.assertEqual(sorted(os.listdir(sec)), ['02_B.pdf'])
+
+
+class TestPlanOnly(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.__argv = sys.argv
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+        sys.argv = self.__argv
+
+    def test_plan_only_does_not_write(self):
+        class Response(object):
+            status_code = 404
+
+        class Session(object):
+            video_cache = coursera_dl.VideoCache(
+                os.path.join(self.tmpdir, 'videos.json'), 0)
+
+            def head(self, url, allow_redirects=False):
+                return Response()
+
+        path = os.path.join(self.tmpdir, 'classes')
+        sys.argv = ['coursera-dl', '-u', 'user', '-p', 'pass',
+                    '--plan-only', '--about', '--verify-fs', '-f', 'pdf',
+                    '--path', path, 'class-001']
+        args = coursera_dl.parseArgs()
+
+        sections = [('Week_1', [
+            ('Welcome', {'pdf': [('http://a.com/1.pdf', '')]})])]
+        completed = coursera_dl.download_class(args, 'class-001', Session(),
+                                               '', sections)
+        self.assertFalse(completed)
+        self.assertFalse(os.path.exists(path))
+
+
+class TestPlaylist(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def test_playlist_follows_lecture_order(self):
+        from coursera.downloaders import Downloader
+
+        tmpdir = self.tmpdir
+
+        sections = [('Week_1', [
+            ('Welcome', {'mp4': [('http://a.com/1.mp4', '')],
+                         'pdf': [('http://a.com/1.pdf', '')]}),
+            ('Basics', {'mp4': [('http://a.com/2.mp4', '')]}),
+            ('Advanced', {'mp4': [('http://a.com/3.mp4', '')]})])]
+
+        cwd = os.getcwd()
+        coursera_dl.download_lectures(Downloader(), 'class', sections,
+                                      ['mp4', 'pdf'], skip_download=True,
+                                      path=tmpdir, playlist=True)
+        self.assertEqual(os.getcwd(), cwd)
+
+        sec = os.path.join(tmpdir, 'class', '01_Week_1')
+        with open(os.path.join(sec, '01_Week_1.m3u')) as m3u:
+            self.assertEqual(m3u.read().splitlines(),
+                             ['01_Welcome.mp4',
+                              '02_Basics.mp4',
+                              '03_Advanced.mp4'])
+
+    def test_playlist_keeps_filtered_videos(self):
+        from coursera.downloaders import Downloader
+
+        sections = [('Week_1', [
+            (name, {'mp4': [('http://a.com/%d.mp4' % i, '')],
+                    'pdf': [('http://a.com/%d.pdf' % i, '')]})
+            for i, name in enumerate(['Welcome', 'Basics', 'Advanced'])])]
+        coursera_dl.download_lectures(Downloader(), 'class', sections,
+                                      ['mp4'], skip_download=True,
+                                      path=self.tmpdir, playlist=True)
+
+        # later runs with filters do not shrink the playlist
+        sec = os.path.join(self.tmpdir, 'class', '01_Week_1')
+        m3u_name = os.path.join(sec, '01_Week_1.m3u')
+        with open(m3u_name) as m3u:
+            expected = m3u.read()
+        coursera_dl.download_lectures(Downloader(), 'class', sections,
+                                      ['mp4'], skip_download=True,
+                                      lecture_filter='Basics',
+                                      path=self.tmpdir, playlist=True)
+        coursera_dl.download_lectures(Downloader(), 'class', sections,
+                                      ['pdf'], skip_download=True,
+                                      path=self.tmpdir, playlist=True)
+        with open(m3u_name) as m3u:
+            self.assertEqual(m3u.read(), expected)
+        self.assertEqual(expected.splitlines(),
+                         ['01_Welcome.mp4',
+                          '02_Basics.mp4',
+                          '03_Advanced.mp4'])
+
+    def test_section_videos_by_lecture_number(self):
+        for name in ('100_C.mp4', '02_B.mp4', '11_A.mp4', '02_B.pdf'):
+            open(os.path.join(self.tmpdir, name), 'w').close()
+
+        self.assertEqual(coursera_dl.section_videos(self.tmpdir),
+                         [os.path.join(self.tmpdir, name)
+                          for name in ('02_B.mp4', '11_A.mp4', '100_C.mp4')])
+
 
 if __name__ == "__main__":
     unittest.main()
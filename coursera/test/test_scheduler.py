@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the download scheduler.
+"""
+
+import threading
+import time
+import unittest
+
+from coursera import scheduler
+from coursera.downloaders import DownloadError
+
+
+class MockDownloader(object):
+
+    def __init__(self, delay=0, fail_on=None, errors=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.errors = errors or {}
+        self.downloaded = []
+        self.running = {}
+        self.max_running = {}
+        self._lock = threading.Lock()
+
+    def download(self, url, filename, headers=None):
+        host = url.split('/')[2]
+        with self._lock:
+            self.running[host] = self.running.get(host, 0) + 1
+            self.max_running[host] = max(self.max_running.get(host, 0),
+                                         self.running[host])
+        time.sleep(self.delay)
+        with self._lock:
+            self.running[host] -= 1
+            self.downloaded.append(filename)
+        if filename == self.fail_on:
+            raise OSError('failed')
+        if self.errors.get(filename):
+            self.errors[filename] -= 1
+            raise DownloadError('Not Found 404', 404)
+
+
+def _make_jobs(hosts, count):
+    return [scheduler.DownloadJob('http://%s/%d.pdf' % (host, i),
+                                  '%s_%d.pdf' % (host, i), 'pdf')
+            for host in hosts for i in range(count)]
+
+
+class DownloadSchedulerTestCase(unittest.TestCase):
+
+    def test_single_job_keeps_order(self):
+        d = MockDownloader()
+        jobs = _make_jobs(['a.com', 'b.com'], 3)
+        scheduler.DownloadScheduler(d, jobs=1).run(jobs)
+        self.assertEqual(d.downloaded, [j.filename for j in jobs])
+
+    def test_all_jobs_are_downloaded(self):
+        d = MockDownloader(delay=0.01)
+        jobs = _make_jobs(['a.com', 'b.com'], 5)
+        scheduler.DownloadScheduler(d, jobs=4).run(jobs)
+        self.assertEqual(sorted(d.downloaded),
+                         sorted(j.filename for j in jobs))
+        self.assertTrue(max(d.max_running.values()) > 1)
+
+    def test_jobs_per_host(self):
+        d = MockDownloader(delay=0.01)
+        jobs = _make_jobs(['a.com', 'b.com'], 6)
+        scheduler.DownloadScheduler(d, jobs=6, jobs_per_host=2).run(jobs)
+        self.assertEqual(len(d.downloaded), 12)
+        self.assertTrue(d.max_running['a.com'] <= 2)
+        self.assertTrue(d.max_running['b.com'] <= 2)
+
+    def test_error_is_raised(self):
+        d = MockDownloader(fail_on='a.com_0.pdf')
+        jobs = _make_jobs(['a.com'], 3)
+        s = scheduler.DownloadScheduler(d, jobs=2)
+        self.assertRaises(OSError, s.run, jobs)
+
+    def test_no_jobs(self):
+        d = MockDownloader()
+        scheduler.DownloadScheduler(d, jobs=3).run([])
+        self.assertEqual(d.downloaded, [])
+
+    def test_failed_jobs_are_retried_later(self):
+        d = MockDownloader(errors={'a.com_0.pdf': 2})
+        jobs = _make_jobs(['a.com'], 3)
+        s = scheduler.DownloadScheduler(d, jobs=1, backoff=0.01)
+        s.run(jobs)
+
+        # the other downloads go on while a.com_0.pdf waits for its retry
+        self.assertEqual(d.downloaded,
+                         ['a.com_0.pdf', 'a.com_1.pdf', 'a.com_2.pdf',
+                          'a.com_0.pdf', 'a.com_0.pdf'])
+        self.assertEqual(s.retried, [jobs[0]])
+        self.assertEqual(jobs[0].attempts, 3)
+        self.assertEqual(s.failed, [])
+
+    def test_jobs_fail_permanently(self):
+        d = MockDownloader(errors={'a.com_1.pdf': 10})
+        jobs = _make_jobs(['a.com'], 2)
+        s = scheduler.DownloadScheduler(d, jobs=2, max_attempts=3,
+                                        backoff=0.01)
+        s.run(jobs)
+
+        self.assertEqual(d.downloaded.count('a.com_1.pdf'), 3)
+        self.assertEqual(len(s.failed), 1)
+        self.assertTrue(s.failed[0][0] is jobs[1])
+        self.assertEqual(s.failed[0][1].status_code, 404)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(scheduler.parse_retry_after(None), None)
+        self.assertEqual(scheduler.parse_retry_after('120'), 120)
+        self.assertEqual(scheduler.parse_retry_after('garbage'), None)
+        self.assertEqual(
+            scheduler.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+
+
+class MockResponse(object):
+
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class MockSession(object):
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+
+    def head(self, url, allow_redirects=False):
+        size = self.sizes.get(url)
+        if size is None:
+            return MockResponse(404)
+        return MockResponse(headers={'content-length': str(size)})
+
+
+class DownloadPlanTestCase(unittest.TestCase):
+
+    def _make_plan(self):
+        jobs = _make_jobs(['a.com'], 4)
+        jobs[3].present = True
+        return scheduler.DownloadPlan(jobs)
+
+    def test_pending_jobs(self):
+        plan = self._make_plan()
+        self.assertEqual(plan.pending(), plan.jobs[:3])
+
+        # present files to be revalidated are pending as well
+        plan.jobs[3].headers = {'If-None-Match': '"abc"'}
+        self.assertEqual(plan.pending(), plan.jobs)
+
+    def test_estimate_sizes(self):
+        plan = self._make_plan()
+        session = MockSession({'http://a.com/0.pdf': 10,
+                               'http://a.com/1.pdf': 30,
+                               'http://a.com/2.pdf': 20,
+                               'http://a.com/3.pdf': 40})
+        plan.estimate_sizes(session, jobs=2)
+
+        self.assertEqual([job.size for job in plan.jobs],
+                         [10, 30, 20, None])
+        self.assertEqual(plan.total_size(), 60)
+
+    def test_unknown_size(self):
+        plan = self._make_plan()
+        plan.estimate_sizes(MockSession({'http://a.com/0.pdf': 10}))
+        self.assertEqual(plan.total_size(), None)
+        self.assertEqual(
+            [job.filename for job in plan.pending('smallest')],
+            ['a.com_0.pdf', 'a.com_1.pdf', 'a.com_2.pdf'])
+
+    def test_order(self):
+        plan = self._make_plan()
+        for job, size in zip(plan.jobs, [10, 30, 20, 40]):
+            job.size = size
+
+        self.assertEqual(
+            [job.size for job in plan.pending('largest')], [30, 20, 10])
+        self.assertEqual(
+            [job.size for job in plan.pending('smallest')], [10, 20, 30])
+        self.assertRaises(ValueError, plan.pending, 'random')
+
+    def test_as_dict(self):
+        plan = self._make_plan()
+        d = plan.as_dict()
+        self.assertEqual(d['pending'], 3)
+        self.assertEqual(d['total_size'], None)
+        self.assertEqual(d['jobs'][3],
+                         {'url': 'http://a.com/3.pdf',
+                          'filename': 'a.com_3.pdf',
+                          'format': 'pdf',
+                          'size': None,
+                          'present': True})
+
+    def test_eta(self):
+        plan = self._make_plan()
+        for job in plan.jobs:
+            job.size = 100
+        self.assertEqual(plan.eta(), None)
+
+        plan.start()
+        self.assertEqual(plan.eta(), None)
+        plan._started -= 10
+        plan.mark_done(plan.jobs[0])
+        self.assertAlmostEqual(plan.eta(), 20, places=0)
+        self.assertTrue('100.00B of 300.00B' in plan.format_eta())
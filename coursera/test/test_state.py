@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the download state database.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from coursera import state
+
+
+class DownloadStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmpdir, 'class-001')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _create_file(self, name, content=b'content'):
+        filename = os.path.join(self.directory, name)
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, 'wb') as f:
+            f.write(content)
+        return filename
+
+    def test_record_and_reload(self):
+        s = state.DownloadState(self.directory)
+        filename = os.path.join(self.directory, '01_week', '01_intro.pdf')
+        self.assertEqual(s.get(filename), None)
+
+        s.record('http://example.com/intro.pdf', filename, 1234,
+                 etag='"abc"', last_modified='Mon, 01 Jan 2014 00:00:00 GMT',
+                 completed=42.0)
+        s.close()
+
+        s = state.DownloadState(self.directory)
+        record = s.get(filename)
+        self.assertEqual(record.url, 'http://example.com/intro.pdf')
+        self.assertEqual(record.size, 1234)
+        self.assertEqual(record.etag, '"abc"')
+        self.assertEqual(record.last_modified,
+                         'Mon, 01 Jan 2014 00:00:00 GMT')
+        self.assertEqual(record.completed, 42.0)
+        s.close()
+
+    def test_record_file(self):
+        filename = self._create_file(os.path.join('01_week', 'a.pdf'))
+
+        s = state.DownloadState(self.directory)
+        s.record_file('http://example.com/a.pdf', filename,
+                      {'etag': '"xyz"'})
+        record = s.get(filename)
+        self.assertEqual(record.size, len(b'content'))
+        self.assertEqual(record.etag, '"xyz"')
+        self.assertEqual(record.completed, os.path.getmtime(filename))
+        s.close()
+
+    def test_forget(self):
+        filename = self._create_file('a.pdf')
+
+        s = state.DownloadState(self.directory)
+        s.record_file('http://example.com/a.pdf', filename)
+        s.forget(filename)
+        s.close()
+
+        s = state.DownloadState(self.directory)
+        self.assertEqual(s.get(filename), None)
+        s.close()
+
+    def test_verify(self):
+        kept = self._create_file('kept.pdf')
+        removed = self._create_file('removed.pdf')
+        changed = self._create_file('changed.pdf')
+
+        s = state.DownloadState(self.directory)
+        for filename in (kept, removed, changed):
+            s.record_file('http://example.com/', filename)
+
+        os.remove(removed)
+        self._create_file('changed.pdf', b'other content')
+
+        self.assertEqual(s.verify(), 2)
+        self.assertTrue(s.get(kept) is not None)
+        self.assertEqual(s.get(removed), None)
+        self.assertEqual(s.get(changed), None)
+        s.close()
@@ -4,8 +4,13 @@
 Test the utility functions.
 """
 
+import os
+import shutil
+import tempfile
 import unittest
 
+import six
+from bs4 import BeautifulSoup
 from six import iteritems
 
 from coursera import utils
@@ -41,6 +46,20 @@ class UtilsTestCase(unittest.TestCase):
         for k, v in iteritems(strings):
             self.assertEquals(utils.clean_filename(k, minimal_change=True), v)
 
+    def test_clean_filenames(self):
+        strings = ['Week 3: Data and Abstraction', '(23:90)', '']
+        self.assertEquals(utils.clean_filenames(strings),
+                          ['Week_3-_Data_and_Abstraction', '', ''])
+        self.assertEquals(utils.clean_filenames(iter(strings), True),
+                          ['Week 3- Data and Abstraction', '(23-90)', ''])
+
+    def test_clean_filename_of_soup_string(self):
+        # the memoized strings must not keep the document alive
+        soup = BeautifulSoup('<p>Lecture 1 (12:34)</p>', 'html.parser')
+        name = utils.clean_filename(soup.p.string, minimal_change=True)
+        self.assertEquals(name, 'Lecture 1 (12-34)')
+        self.assertTrue(type(name) is six.text_type)
+
     def test_get_anchor_format(self):
         strings = {
             'https://class.coursera.org/sub?q=123_en&format=txt': 'txt',
@@ -65,3 +84,80 @@ class UtilsTestCase(unittest.TestCase):
 
         url = ""
         self.assertEquals(utils.fix_url(url), "")
+
+
+class DirectoryIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'a.pdf')
+        open(self.filename, 'w').close()
+        os.utime(self.filename, (1000, 1000))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_scan_directory(self):
+        listing = utils.scan_directory(self.tmpdir)
+        self.assertEqual(list(listing.keys()), ['a.pdf'])
+        self.assertEqual(listing['a.pdf'].stat().st_mtime, 1000)
+
+        missing = os.path.join(self.tmpdir, 'missing')
+        self.assertEqual(utils.scan_directory(missing), {})
+
+    def test_index(self):
+        index = utils.DirectoryIndex()
+        self.assertTrue(index.exists(self.filename))
+        self.assertFalse(index.exists(os.path.join(self.tmpdir, 'b.pdf')))
+        self.assertFalse(index.exists(
+            os.path.join(self.tmpdir, 'missing', 'a.pdf')))
+        self.assertEqual(index.getmtime(self.filename), 1000)
+        self.assertRaises(OSError, index.getmtime,
+                          os.path.join(self.tmpdir, 'b.pdf'))
+
+    def test_directory_is_listed_once(self):
+        index = utils.DirectoryIndex()
+        self.assertTrue(index.exists(self.filename))
+
+        # files created afterwards are not seen
+        open(os.path.join(self.tmpdir, 'b.pdf'), 'w').close()
+        self.assertFalse(index.exists(os.path.join(self.tmpdir, 'b.pdf')))
+
+
+class LookaheadMapTestCase(unittest.TestCase):
+
+    def test_results_in_order(self):
+        for ahead in (0, 1, 3):
+            results = [(item, result())
+                       for item, result in utils.lookahead_map(
+                           lambda x: x * 2, [1, 2, 3, 4], ahead)]
+            self.assertEqual(results, [(1, 2), (2, 4), (3, 6), (4, 8)])
+
+    def test_errors_are_raised_by_result(self):
+        class Error(BaseException):
+            pass
+
+        def func(x):
+            if x == 2:
+                raise ValueError(x)
+            if x == 3:
+                raise Error(x)
+            return x
+
+        results = list(utils.lookahead_map(func, [1, 2, 3, 4], 1))
+        self.assertEqual(results[0][1](), 1)
+        self.assertRaises(ValueError, results[1][1])
+        self.assertRaises(Error, results[2][1])
+        self.assertEqual(results[3][1](), 4)
+
+    def test_bounded_lookahead(self):
+        started = []
+
+        def func(x):
+            started.append(x)
+            return x
+
+        for item, result in utils.lookahead_map(func, range(6), 2):
+            result()
+            # only the next two items can have been started
+            self.assertTrue(max(started) <= item + 2)
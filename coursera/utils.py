@@ -5,10 +5,14 @@ This module provides utility functions that are used within the script.
 """
 
 import errno
+import functools
+import multiprocessing
 import os
 import re
 import string
 
+from multiprocessing.pool import ThreadPool
+
 import six
 
 #  six.moves doesn’t support urlparse
@@ -18,6 +22,55 @@ else:
     from urlparse import urlparse
 
 
+try:
+    from functools import lru_cache
+except ImportError:  # Python 2
+    def lru_cache(maxsize=128):
+        """
+        Minimal stand-in for functools.lru_cache, which forgets everything
+        once maxsize results are stored instead of only the oldest one.
+        """
+        def decorator(func):
+            cache = {}
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = args + tuple(sorted(kwargs.items()))
+                try:
+                    return cache[key]
+                except KeyError:
+                    pass
+
+                if len(cache) >= maxsize:
+                    cache.clear()
+                result = cache[key] = func(*args, **kwargs)
+                return result
+            return wrapper
+        return decorator
+
+
+_VALID_CHARS = '-_.()' + string.ascii_letters + string.digits
+
+
+class _FilenameTable(dict):
+    """
+    Translation table keeping the valid characters of filenames, turning
+    spaces into underscores and deleting everything else.
+    """
+
+    def __init__(self):
+        dict.__init__(self, ((i, None) for i in range(128)))
+        self.update((ord(c), six.text_type(c)) for c in _VALID_CHARS)
+        self[ord(' ')] = six.u('_')
+
+    def __missing__(self, key):
+        return None
+
+
+_FILENAME_TABLE = _FilenameTable()
+_INVALID_CHARS_RE = re.compile('[^%s]' % re.escape(_VALID_CHARS))
+
+
 def clean_filename(s, minimal_change=False):
     """
     Sanitize a string to be used as a filename.
@@ -25,19 +78,46 @@ def clean_filename(s, minimal_change=False):
     If minimal_change is set to true, then we only strip the bare minimum of
     characters that are problematic for filesystems (namely, ':', '/' and
     '\x00', '\n').
+
+    The results are memoized, as the same names come up again and again.
     """
 
-    # strip paren portions which contain trailing time length (...)
-    s = s.replace(':', '-').replace('/', '-').replace('\x00', '-').replace('\n', '')
+    # only plain strings are memoized: the strings of BeautifulSoup would
+    # keep their whole document alive
+    if isinstance(s, six.text_type):
+        s = six.text_type(s)
+    else:
+        s = str(s)
+    return _clean_filename(s, minimal_change)
+
+
+@lru_cache(maxsize=4096)
+def _clean_filename(s, minimal_change):
+    s = s.replace(':', '-').replace('/', '-').replace('\x00', '-')
+    s = s.replace('\n', '')
 
     if minimal_change:
         return s
 
-    s = re.sub(r"\([^\(]*$", '', s)
+    # strip paren portions which contain trailing time length (...),
+    # that is from the last opening paren
+    paren = s.rfind('(')
+    if paren >= 0:
+        s = s[:paren]
     s = s.replace('nbsp', '')
-    s = s.strip().replace(' ', '_')
-    valid_chars = '-_.()%s%s' % (string.ascii_letters, string.digits)
-    return ''.join(c for c in s if c in valid_chars)
+    s = s.strip()
+
+    if isinstance(s, six.text_type):
+        return s.translate(_FILENAME_TABLE)
+    # byte strings with Python 2
+    return _INVALID_CHARS_RE.sub('', s.replace(' ', '_'))
+
+
+def clean_filenames(strings, minimal_change=False):
+    """
+    Return the list of the given strings sanitized with clean_filename.
+    """
+    return [clean_filename(s, minimal_change) for s in strings]
 
 
 def get_anchor_format(a):
@@ -79,3 +159,191 @@ def fix_url(url):
         url = "http://" + url
 
     return url
+
+
+def get_host(url):
+    """
+    Return the host part (netloc) of the given url.
+    """
+    return urlparse(url).netloc
+
+
+def get_file_size(filename):
+    """
+    Return the size of the given file, or 0 if it does not exist.
+    """
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+class _DirEntry(object):
+    """
+    Stand-in for os.DirEntry on Pythons without os.scandir.
+    """
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+def scan_directory(directory):
+    """
+    Return a dictionary mapping the names of the entries of directory to
+    their DirEntry, whose stat() is only called (and then cached) when
+    needed.  A missing directory is empty.
+    """
+    try:
+        if hasattr(os, 'scandir'):
+            return dict((entry.name, entry)
+                        for entry in os.scandir(directory))
+        return dict((name, _DirEntry(directory, name))
+                    for name in os.listdir(directory))
+    except OSError as exc:
+        if exc.errno in (errno.ENOENT, errno.ENOTDIR):
+            return {}
+        raise
+
+
+class DirectoryIndex(object):
+    """
+    Answers existence queries about files from a single listing of each
+    directory, instead of probing every file, which is slow on network
+    filesystems.  The other queries still stat the file, once: the result
+    is kept in the listing (it comes with the listing on Windows).
+
+    The listings are not updated; files created after a directory has
+    been listed are not seen.
+    """
+
+    def __init__(self):
+        self._listings = {}
+
+    def _lookup(self, filename):
+        directory, name = os.path.split(filename)
+        listing = self._listings.get(directory)
+        if listing is None:
+            listing = self._listings[directory] = scan_directory(
+                directory or os.curdir)
+        return listing.get(name)
+
+    def exists(self, filename):
+        return self._lookup(filename) is not None
+
+    def stat(self, filename):
+        entry = self._lookup(filename)
+        if entry is None:
+            raise OSError(errno.ENOENT, 'No such file', filename)
+        return entry.stat()
+
+    def getmtime(self, filename):
+        return self.stat(filename).st_mtime
+
+
+def replace_file(src, dst):
+    """
+    Rename src to dst, replacing dst if it already exists.
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        # os.rename does not overwrite existing files on Windows
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def parallel_map(func, items, jobs=1):
+    """
+    Return [func(item) for item in items], running up to `jobs` calls at
+    the same time in threads.
+    """
+    items = list(items)
+    if jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    pool = ThreadPool(min(jobs, len(items)))
+    try:
+        # A timeout is needed for KeyboardInterrupt to get through
+        return pool.map_async(func, items).get(60 * 60 * 24)
+    finally:
+        pool.terminate()
+
+
+def _call(func, item):
+    # the exceptions which are not derived from Exception would kill the
+    # worker thread of the pool, so they are passed back as results
+    try:
+        return True, func(item)
+    except BaseException as e:
+        return False, e
+
+
+def _get_result(async_result):
+    # A timeout is needed for KeyboardInterrupt to get through
+    ok, value = async_result.get(60 * 60 * 24)
+    if not ok:
+        raise value
+    return value
+
+
+def lookahead_map(func, items, ahead=1):
+    """
+    Generate (item, result) for each item, in order, where result is a
+    function returning func(item), or raising its exception.  The calls
+    are made one after the other in a background thread, up to `ahead`
+    items in advance of the one handed to the caller, so that the caller
+    can work on an item while the next ones are being prepared.  With
+    ahead=0, func(item) is only called by result.
+    """
+    items = list(items)
+    if ahead < 1 or len(items) <= 1:
+        for item in items:
+            yield item, functools.partial(func, item)
+        return
+
+    pool = ThreadPool(1)
+    pending = []
+    try:
+        for item in items:
+            pending.append((item, pool.apply_async(_call, (func, item))))
+            if len(pending) <= ahead:
+                continue
+
+            item, async_result = pending.pop(0)
+            yield item, functools.partial(_get_result, async_result)
+
+        for item, async_result in pending:
+            yield item, functools.partial(_get_result, async_result)
+    except BaseException:
+        # interrupted, or abandoned by the caller
+        pool.terminate()
+        raise
+
+    # let the last calls finish, as their results may not have been read
+    pool.close()
+
+
+def process_map(func, items, processes=1):
+    """
+    Return [func(item) for item in items], running up to `processes` calls
+    at the same time in worker processes.  func must be a module level
+    function, and the items and results must be picklable.
+    """
+    items = list(items)
+    if processes <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    pool = multiprocessing.Pool(min(processes, len(items)))
+    try:
+        # A timeout is needed for KeyboardInterrupt to get through
+        return pool.map_async(func, items).get(60 * 60 * 24)
+    finally:
+        pool.terminate()